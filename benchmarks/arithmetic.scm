@@ -0,0 +1,23 @@
+; Integer and floating point arithmetic in tight loops.
+
+(define (sum-squares n)
+  (define (loop i acc)
+    (if (> i n) acc (loop (+ i 1) (+ acc (* i i)))))
+  (loop 1 0))
+
+(define (gcd a b)
+  (if (= b 0) a (gcd b (modulo a b))))
+
+(define (sum-gcds n)
+  (define (loop i acc)
+    (if (> i n) acc (loop (+ i 1) (+ acc (gcd (* i 7919) (* i 104729))))))
+  (loop 1 0))
+
+(define (harmonic n)
+  (define (loop i acc)
+    (if (> i n) acc (loop (+ i 1) (+ acc (/ 1.0 i)))))
+  (loop 1 0.0))
+
+(sum-squares 10000)
+(sum-gcds 2000)
+(harmonic 10000)
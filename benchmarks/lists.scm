@@ -0,0 +1,25 @@
+; List building: cons, append, reverse and map over long lists.
+
+(define (range a b)
+  (define (build i acc)
+    (if (< i a) acc (build (- i 1) (cons i acc))))
+  (build (- b 1) nil))
+
+(define (reverse-onto xs acc)
+  (if (null? xs) acc (reverse-onto (cdr xs) (cons (car xs) acc))))
+
+(define (map-list f xs)
+  (define (loop xs acc)
+    (if (null? xs) acc (loop (cdr xs) (cons (f (car xs)) acc))))
+  (reverse-onto (loop xs nil) nil))
+
+(define (repeat k thunk)
+  (if (> k 0)
+      (begin (thunk) (repeat (- k 1) thunk))
+      k))
+
+(define numbers (range 0 200))
+
+(repeat 50 (lambda () (append numbers numbers numbers)))
+(repeat 5 (lambda () (length (reverse-onto (range 0 2000) nil))))
+(repeat 5 (lambda () (map-list (lambda (x) (* x x)) (range 0 2000))))
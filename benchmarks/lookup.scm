@@ -0,0 +1,27 @@
+; Variable lookup through many enclosing frames.
+
+(define g1 1)
+(define g2 2)
+
+(define (nest a)
+  (lambda (b)
+    (lambda (c)
+      (lambda (d)
+        (lambda (e)
+          (lambda (f)
+            (lambda (g)
+              (lambda (h)
+                (+ a b c d e f g h g1 g2)))))))))
+
+(define innermost (((((((nest 1) 2) 3) 4) 5) 6) 7))
+
+(define (loop i acc)
+  (if (= i 0)
+      acc
+      (loop (- i 1)
+            (let ((x 1))
+              (let ((y 2))
+                (let ((z 3))
+                  (+ acc (innermost i) x y z g1 g2)))))))
+
+(loop 10000 0)
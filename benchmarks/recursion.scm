@@ -0,0 +1,19 @@
+; Deep non-tail recursion: every call waits on the result of the next.
+
+(define (count-down n)
+  (if (= n 0)
+      0
+      (+ 1 (count-down (- n 1)))))
+
+(define (fib n)
+  (if (< n 2)
+      n
+      (+ (fib (- n 1)) (fib (- n 2)))))
+
+(define (repeat k thunk)
+  (if (> k 0)
+      (begin (thunk) (repeat (- k 1) thunk))
+      k))
+
+(repeat 300 (lambda () (count-down 120)))
+(fib 18)
@@ -0,0 +1,12 @@
+; Tail calls: loops that must run in constant stack space.
+
+(define (loop i acc)
+  (if (= i 0)
+      acc
+      (loop (- i 1) (+ acc i))))
+
+(define (even? n) (if (= n 0) #t (odd? (- n 1))))
+(define (odd? n) (if (= n 0) #f (even? (- n 1))))
+
+(loop 30000 0)
+(even? 20000)
@@ -0,0 +1,55 @@
+; The reader and tokenizer on a large file of quoted data.  The runner
+; reads this file REPEAT times in one session, numbering each {i}, so that
+; most numerals and symbols are different in every repetition.
+; repeat: 400
+
+'(cons define z{i} define car gamma{i} alpha{i} 37.763{i} (43244{i} gamma{i} car lambda) #t #f . 0{i})
+'(43609{i} define 98767{i} 25.004{i} 79606{i} car gamma{i} define (cons lambda -15.414{i} define) #t #f . 1{i})
+'(50600{i} x{i} define cdr car beta{i} beta{i} -38.605{i} (car define 93591{i} gamma{i}) #t #f . 2{i})
+'(92.394{i} 0.644{i} -84.683{i} delta{i} -64.334{i} 95760{i} y{i} x{i} (define lambda -63.570{i} cdr) #t #f . 3{i})
+'(gamma{i} 10833{i} 29.274{i} beta{i} cdr -15.041{i} car y{i} (94072{i} 56.926{i} 16628{i} 31.766{i}) #t #f . 4{i})
+'(62886{i} gamma{i} 74498{i} 5954{i} cdr -35.624{i} 34.944{i} cdr (17343{i} 35713{i} 79817{i} 17003{i}) #t #f . 5{i})
+'(39658{i} x{i} -64.287{i} -16.758{i} cons -71.438{i} 96060{i} 12352{i} (75786{i} x{i} cdr delta{i}) #t #f . 6{i})
+'(z{i} lambda 99661{i} -6.880{i} 27.554{i} 23923{i} 11.961{i} 69403{i} (-70.685{i} alpha{i} x{i} 41497{i}) #t #f . 7{i})
+'(cdr 49339{i} cons lambda 16.528{i} x{i} 87789{i} gamma{i} (alpha{i} delta{i} define 17.047{i}) #t #f . 8{i})
+'(41818{i} x{i} 9.645{i} -84.846{i} -11.662{i} delta{i} beta{i} beta{i} (22624{i} beta{i} z{i} delta{i}) #t #f . 9{i})
+'(-53.282{i} beta{i} 12.653{i} 1730{i} 76.022{i} gamma{i} gamma{i} 17368{i} (77362{i} cons alpha{i} delta{i}) #t #f . 10{i})
+'(alpha{i} 99824{i} alpha{i} 25194{i} 82543{i} beta{i} delta{i} delta{i} (31.128{i} x{i} lambda 27.568{i}) #t #f . 11{i})
+'(delta{i} 25358{i} -15.532{i} 30407{i} beta{i} beta{i} y{i} delta{i} (define cdr car 15038{i}) #t #f . 12{i})
+'(x{i} gamma{i} 99713{i} 62.686{i} beta{i} 36379{i} define lambda (99464{i} -53.848{i} cdr 9.284{i}) #t #f . 13{i})
+'(delta{i} 49315{i} -90.633{i} 51.260{i} x{i} cdr x{i} car (-60.851{i} 8370{i} cons 67.395{i}) #t #f . 14{i})
+'(cdr 48985{i} 16.398{i} car 27.174{i} beta{i} z{i} define (gamma{i} 816{i} -13.961{i} cons) #t #f . 15{i})
+'(beta{i} alpha{i} delta{i} 56335{i} alpha{i} delta{i} car gamma{i} (-38.518{i} alpha{i} lambda 92526{i}) #t #f . 16{i})
+'(car define 85084{i} alpha{i} 80651{i} alpha{i} car y{i} (y{i} 63.551{i} 90946{i} 40769{i}) #t #f . 17{i})
+'(86.539{i} alpha{i} car 80080{i} define -23.334{i} car 57.246{i} (29562{i} gamma{i} 57447{i} define) #t #f . 18{i})
+'(car -84.334{i} z{i} 50247{i} 79828{i} -70.107{i} 26205{i} y{i} (car 8365{i} delta{i} 38820{i}) #t #f . 19{i})
+'(beta{i} 49462{i} 23616{i} x{i} 7364{i} 35850{i} 40725{i} x{i} (70.712{i} 13.788{i} x{i} cdr) #t #f . 20{i})
+'(-39.186{i} -52.478{i} car alpha{i} 4.312{i} -22.995{i} car -46.201{i} (45.184{i} -25.366{i} car 30451{i}) #t #f . 21{i})
+'(22076{i} 59788{i} cdr 63856{i} alpha{i} 88127{i} cons x{i} (23958{i} beta{i} car 83.511{i}) #t #f . 22{i})
+'(94.679{i} define -6.116{i} -92.851{i} -80.037{i} delta{i} 3831{i} car (lambda cons beta{i} 81.530{i}) #t #f . 23{i})
+'(22854{i} alpha{i} 70.296{i} car -20.131{i} 98080{i} 15003{i} 22960{i} (car define define z{i}) #t #f . 24{i})
+'(delta{i} -87.802{i} -45.966{i} 70.165{i} define -79.490{i} delta{i} 32.096{i} (-2.924{i} cdr 97168{i} 17.278{i}) #t #f . 25{i})
+'(gamma{i} -41.358{i} cdr x{i} cdr alpha{i} -90.283{i} y{i} (1196{i} x{i} cons z{i}) #t #f . 26{i})
+'(99473{i} cdr car lambda -88.028{i} define 8576{i} gamma{i} (8592{i} y{i} cons 73619{i}) #t #f . 27{i})
+'(97835{i} 65769{i} 66381{i} 53908{i} 80814{i} define 22088{i} 40471{i} (-87.549{i} -77.968{i} -86.033{i} car) #t #f . 28{i})
+'(car alpha{i} cdr define 44702{i} lambda gamma{i} -62.278{i} (beta{i} 62986{i} delta{i} 80310{i}) #t #f . 29{i})
+'(car delta{i} 61180{i} beta{i} beta{i} 6361{i} lambda 83761{i} (93.630{i} 64314{i} 48807{i} cdr) #t #f . 30{i})
+'(z{i} 49317{i} 59462{i} 9529{i} 62333{i} lambda 77697{i} cons (-40.865{i} define 27177{i} beta{i}) #t #f . 31{i})
+'(beta{i} 95.120{i} 69.669{i} alpha{i} 25712{i} z{i} beta{i} lambda (40441{i} 90624{i} 69.221{i} delta{i}) #t #f . 32{i})
+'(-72.856{i} -87.225{i} 77786{i} 92065{i} z{i} -21.532{i} beta{i} lambda (cdr gamma{i} x{i} lambda) #t #f . 33{i})
+'(80994{i} cdr 64210{i} 70104{i} -61.867{i} 23892{i} -76.829{i} 95444{i} (y{i} y{i} -68.815{i} beta{i}) #t #f . 34{i})
+'(cdr x{i} 51288{i} z{i} lambda 41.606{i} 36989{i} 69613{i} (-69.041{i} 80926{i} 86111{i} gamma{i}) #t #f . 35{i})
+'(delta{i} y{i} 64277{i} define 87.255{i} 46.995{i} cons 1.324{i} (46414{i} 5983{i} car 97087{i}) #t #f . 36{i})
+'(z{i} -83.079{i} car 98.000{i} lambda -52.623{i} 57698{i} gamma{i} (y{i} cons cdr x{i}) #t #f . 37{i})
+'(42.156{i} beta{i} cons cdr z{i} -93.646{i} 57546{i} z{i} (cdr 25861{i} 38112{i} beta{i}) #t #f . 38{i})
+'(90183{i} y{i} 18413{i} 1423{i} 35300{i} 32983{i} 13.353{i} 74364{i} (27138{i} 47955{i} define 18.214{i}) #t #f . 39{i})
+'(93578{i} cons delta{i} 7067{i} 955{i} cons gamma{i} 23966{i} (lambda 49338{i} -25.522{i} 84100{i}) #t #f . 40{i})
+'(delta{i} -64.359{i} delta{i} 3092{i} cons 9568{i} 3.207{i} 67035{i} (beta{i} -44.233{i} define -96.921{i}) #t #f . 41{i})
+'(x{i} lambda 70368{i} 70472{i} 81.500{i} 71234{i} 70068{i} gamma{i} (12729{i} beta{i} 96493{i} y{i}) #t #f . 42{i})
+'(z{i} 52055{i} delta{i} 75893{i} delta{i} 68589{i} x{i} y{i} (alpha{i} -59.453{i} 13.634{i} 68149{i}) #t #f . 43{i})
+'(lambda 6910{i} -0.303{i} gamma{i} define x{i} 27.305{i} x{i} (gamma{i} 58.245{i} 2559{i} 92058{i}) #t #f . 44{i})
+'(delta{i} define 66401{i} delta{i} define cdr car 90565{i} (define cdr -43.044{i} define) #t #f . 45{i})
+'(10467{i} z{i} alpha{i} gamma{i} x{i} y{i} 48460{i} 2811{i} (31879{i} cons 73.742{i} lambda) #t #f . 46{i})
+'(63.319{i} x{i} car 88598{i} -44.914{i} 83.400{i} y{i} 71.659{i} (z{i} -59.162{i} 8511{i} beta{i}) #t #f . 47{i})
+'(51905{i} 97238{i} gamma{i} cdr 1052{i} gamma{i} cdr 99494{i} (96306{i} z{i} 52.328{i} -46.556{i}) #t #f . 48{i})
+'(beta{i} y{i} lambda 67.534{i} 6019{i} 93.122{i} -12.457{i} 50062{i} (33665{i} 61386{i} car alpha{i}) #t #f . 49{i})
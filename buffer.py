@@ -1,13 +1,20 @@
 """The buffer module implements a Buffer class for iterating through tokens."""
 
 import math
+from collections import deque
+
+class LinePart(list):
+    """The tokens of part of a line, which continues in the next list of
+    tokens returned by the source of a Buffer."""
 
 class Buffer(object):
     """A Buffer provides a way of accessing a sequence of tokens across lines.
 
     Its constructor takes an iterator, called "the source", that returns the
     next line of tokens as a list each time it is queried, or None to indicate
-    the end of data.
+    the end of data.  A source may split a line into several lists by
+    returning a LinePart for each list but the last; those lists are numbered
+    as one line.
 
     The Buffer in effect concatenates the sequences returned from its source
     and then supplies the items from them one at a time through its pop()
@@ -16,8 +23,10 @@ class Buffer(object):
     In addition, Buffer provides a current method to look at the
     next item to be supplied, without sequencing past it.
 
-    The __str__ method prints all tokens read so far, up to the end of the
-    current line, and marks the current token with >>.
+    The __str__ method prints the tokens of the most recent lines read, up to
+    the end of the current line, and marks the current token with >>.  Only
+    the last HISTORY lines are kept, so a Buffer uses constant memory however
+    long its source is.
 
     >>> buf = Buffer(iter([['(', '+'], [15], [12, ')']]))
     >>> buf.pop()
@@ -46,12 +55,30 @@ class Buffer(object):
     2: 15
     3: 12 ) >>
     >>> buf.pop()  # returns None
+    >>> buf = Buffer(iter([[1], [2], [3], [4], [5, 6]]), history=2)
+    >>> [buf.pop() for _ in range(5)]
+    [1, 2, 3, 4, 5]
+    >>> print(buf)
+    4: 4
+    5: 5 >> 6
+    >>> buf = Buffer(iter([[1], LinePart([2]), LinePart([3]), [4], [5]]))
+    >>> [buf.pop() for _ in range(4)]
+    [1, 2, 3, 4]
+    >>> buf.line_count
+    2
+    >>> print(buf)
+    1: 1
+    2: 2
+    2: 3
+    2: 4 >>
     """
     __EMPTY = iter(())
 
-    def __init__(self, source):
+    def __init__(self, source, history=4):
         self.index = 0
-        self.lines = []
+        self.lines = deque(maxlen=history) # The most recent lines read
+        self.line_count = 0
+        self.line_ended = True # Whether the next list begins a new line
         self.source = source
         self.current_line = ()
 
@@ -66,24 +93,28 @@ class Buffer(object):
         """Return the current element, or None if none exists."""
         while self.index >= len(self.current_line):
             self.index = 0
-            try:
-                self.current_line = next(self.source)
-                self.lines.append(self.current_line)
-            except StopIteration:
+            line = next(self.source, None)
+            if line is None:
                 self.current_line = ()
                 return None
+            self.current_line = line
+            if self.line_ended:
+                self.line_count += 1
+            self.line_ended = not isinstance(line, LinePart)
+            self.lines.append((self.line_count, line))
         return self.current_line[self.index]
 
     def __str__(self):
         """Return recently read contents; current element marked with >>."""
         # Format string for right-justified line numbers
-        n = len(self.lines)
+        n = self.line_count
         msg = '{0:>' + str(math.floor(math.log10(n))+1) + "}: "
 
-        # Up to three previous lines and current line are included in output
+        # Previous lines still in the history and current line are included
+        previous = list(self.lines)[:-1]
         s = ''
-        for i in range(max(0, n-4), n-1):
-            s += msg.format(i+1) + ' '.join(map(str, self.lines[i])) + '\n'
+        for i, line in previous:
+            s += msg.format(i) + ' '.join(map(str, line)) + '\n'
         s += msg.format(n)
         s += ' '.join(map(str, self.current_line[:self.index]))
         s += ' >> '
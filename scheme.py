@@ -16,9 +16,17 @@ Eval/Apply mutual recurrence, source code parsing, and the read-eval-print
 interactive loop.
 """
 
+import codecs
+import functools
+import mmap
+import os
+import pickle
 import sys
+import threading
+import time
 from ucb import main, trace
-from scheme_tokens import tokenize_lines, DELIMITERS
+from scheme_tokens import (tokenize_lines, tokenize_chunks, warning_count,
+                           DELIMITERS)
 from scheme_primitives import *
 from buffer import Buffer
 
@@ -26,61 +34,75 @@ from buffer import Buffer
 # Eval/Apply #
 ##############
 
-def scheme_eval(expr, env):
+def scheme_eval(expr, env, profiled=False):
     """Evaluate Scheme expression EXPR in enivornment ENV.
 
+    Expressions in tail position (the result of a logical special form, the
+    body of a let, and the body of a called LambdaProcedure) are evaluated by
+    looping rather than recursing, so iterative Scheme procedures run in
+    constant Python stack depth.  PROFILED is true when EXPR is the body of a
+    procedure whose call is being recorded by the PROFILER, which a tail call
+    then replaces.
+
     >>> expr = read_line("(+ 2 2)")
     >>> expr
     Pair('+', Pair(2, Pair(2, NULL)))
     >>> scheme_eval(expr, create_global_frame())
     4
     """
-    if expr is None:
-        raise SchemeError("Cannot evaluate an undefined expression.")
-
-    # Evaluate Atoms
-    if scheme_symbolp(expr):
-        return env[expr]
-    elif scheme_atomp(expr):
-        return expr
+    while True:
+        if expr is None:
+            raise SchemeError("Cannot evaluate an undefined expression.")
 
-    # All non-atomic expressions are lists.
-    if not scheme_listp(expr):
-        raise SchemeError("malformed list: {0}".format(str(expr)))
-    first, rest = expr.first, expr.second
+        # Evaluate Atoms
+        if scheme_symbolp(expr):
+            return env[expr]
+        elif scheme_atomp(expr):
+            return expr
 
-    # Evaluate Combinations
-    if first in LOGIC_FORMS:
-        return scheme_eval(LOGIC_FORMS[first](rest, env), env)
-    elif first == "lambda":
-        return do_lambda_form(rest, env)
-    elif first == "define":
-        do_define_form(rest, env)
-        return None
-    elif first == "quote":
-        return do_quote_form(rest)
-    elif first == "let":
-        expr, env = do_let_form(rest, env)
-        return scheme_eval(expr, env)
-    elif first == "let*":
-        expr, env = do_let_star_form(rest, env)
-        return scheme_eval(expr, env)
+        # Vectors evaluate to themselves; all other expressions are lists.
+        if not scheme_listp(expr):
+            if scheme_vectorp(expr):
+                return expr
+            raise SchemeError("malformed list: {0}".format(str(expr)))
+        first, rest = expr.first, expr.second
 
-    else:
-        procedure = scheme_eval(first, env)
-        args = rest.map(lambda operand: scheme_eval(operand, env))
-        return scheme_apply(procedure, args, env)
+        # Evaluate Combinations
+        form = SPECIAL_FORMS.get(first)
+        if form is not None:
+            kind, do_form = form
+            if kind is TAIL_FORM:
+                expr = do_form(rest, env)
+                if expr is None:
+                    return None
+            elif kind is SCOPE_FORM:
+                expr, env = do_form(rest, env)
+            else:
+                return do_form(rest, env)
+        else:
+            procedure = scheme_eval(first, env)
+            args = rest.map(lambda operand: scheme_eval(operand, env))
+            if not isinstance(procedure, LambdaProcedure):
+                return scheme_apply(procedure, args, env)
+            elif PROFILER is not None:
+                if not profiled:
+                    return profiled_apply(procedure, args, env)
+                PROFILER.tail_call(procedure)
+            # Tail call: continue with the body in the new frame
+            env = procedure.env.make_call_frame(procedure.formals, args)
+            expr = procedure.body
 
 def scheme_apply(procedure, args, env):
     """Apply scheme PROCEDURE to argument values ARGS in environment ENV."""
+    if PROFILER is not None and (PROFILER.primitives
+                                 or isinstance(procedure, LambdaProcedure)):
+        return profiled_apply(procedure, args, env)
     if isinstance(procedure, PrimitiveProcedure):
         arg_list = [arg for arg in args]
         return apply_primitive(procedure, arg_list, env)
     elif isinstance(procedure, LambdaProcedure):
-        "*** YOUR CODE HERE ***"
-        arg_list = [arg for arg in args]
-        new_frame = env.make_call_frame(procedure.formals,args)
-        return scheme_eval(procedure.body,new_frame)
+        new_frame = procedure.env.make_call_frame(procedure.formals, args)
+        return scheme_eval(procedure.body, new_frame)
     else:
         raise SchemeError("Cannot call {0}".format(repr(procedure)))
 
@@ -115,13 +137,20 @@ class Frame:
     """An environment frame, representing a mapping from Scheme symbols to
     Scheme values, possibly enclosed within another frame."""
 
+    scope = None  # Frames are laid out dynamically; see CallFrame
+
     def __init__(self, parent):
         """An empty frame that is attached to the frame parent."""
         self.inner = {}
         self.parent = parent
 
     def __getitem__(self, sym):
-        return self.find(sym).inner[sym]
+        frame = self
+        while frame is not None:
+            if sym in frame.inner:
+                return frame.inner[sym]
+            frame = frame.parent
+        raise SchemeError("unknown identifier: {0}".format(str(sym)))
 
     def __repr__(self):
         if self.parent is None:
@@ -133,11 +162,11 @@ class Frame:
     def find(self, sym):
         """The environment frame at or parent SELF that defined SYM.  It
         is an error if SYM does not exist."""
-        for name in self.inner.keys():
-            if name  == sym:
-                return self
-        if self.parent != None:
-            return Frame.find(self.parent,sym)  
+        frame = self
+        while frame is not None:
+            if sym in frame.inner:
+                return frame
+            frame = frame.parent
         raise SchemeError("unknown identifier: {0}".format(str(sym)))
 
     def global_frame(self):
@@ -167,31 +196,142 @@ class Frame:
         <{a: 1, b: (2 3)} -> <Global Frame>>
         """
         frame = Frame(self)
-        try:
-            len(formals)
-            for (key, val) in zip(formals, vals):
-                frame.inner[key] = val
-        except  SchemeError: 
-            frame.inner[formals.first]=vals.first
-            frame.inner[formals.second]=vals.second        
+        while isinstance(formals, Pair):
+            if not isinstance(vals, Pair):
+                raise SchemeError("too few arguments")
+            frame.inner[formals.first] = vals.first
+            formals, vals = formals.second, vals.second
+        if formals is NULL:
+            if vals is not NULL:
+                raise SchemeError("too many arguments")
+        else:
+            frame.inner[formals] = vals
         return frame
 
     def define(self, sym, val):
         """Define Scheme symbol SYM to have value VAL in SELF."""
         self.inner[sym] = val
 
+class Unassigned:
+    """The value of a local name whose define form has not been evaluated."""
+
+    def __repr__(self):
+        return "UNASSIGNED"
+
+UNASSIGNED = Unassigned()
+
+class Scope:
+    """The static layout of the local frames created by one lambda expression
+    or let form in analyzed code: the names bound in those frames, in slot
+    order, and the Scope of the enclosing frame (None for the global frame).
+    """
+
+    __slots__ = ('names', 'parent', 'defined')
+
+    def __init__(self, names, parent):
+        self.names = list(names)
+        self.parent = parent
+        self.defined = set() # Slots bound by define, which may be UNASSIGNED
+
+    def add(self, name, defined=False):
+        """Return the slot of NAME, adding a new slot if it has none."""
+        if name not in self.names:
+            self.names.append(name)
+            if defined:
+                self.defined.add(len(self.names) - 1)
+        return self.names.index(name)
+
+    def resolve(self, name):
+        """The lexical address of NAME as a pair (depth, scope): the number of
+        frames between a frame laid out by SELF and the one that binds NAME,
+        and the Scope of that frame (None if NAME is global).
+
+        >>> scope = Scope(["x"], Scope(["y", "z"], None))
+        >>> scope.resolve("z")[0], scope.resolve("z")[1].names.index("z")
+        (1, 1)
+        >>> scope.resolve("car")
+        (2, None)
+        """
+        depth, scope = 0, self
+        while scope is not None:
+            if name in scope.names:
+                return depth, scope
+            depth, scope = depth + 1, scope.parent
+        return depth, None
+
+class CallFrame:
+    """A local environment frame created by analyzed code, in which the values
+    of the names in a Scope are stored in a list of slots, attached to a parent
+    CallFrame or to the global Frame."""
+
+    __slots__ = ('slots', 'parent', 'scope')
+
+    def __init__(self, slots, parent, scope):
+        self.slots = slots
+        self.parent = parent
+        self.scope = scope
+
+    def __getitem__(self, sym):
+        frame = self
+        while isinstance(frame, CallFrame):
+            names = frame.scope.names
+            if sym in names:
+                value = frame.slots[names.index(sym)]
+                if value is UNASSIGNED:
+                    break
+                return value
+            frame = frame.parent
+        else:
+            return frame[sym]
+        raise SchemeError("unknown identifier: {0}".format(str(sym)))
+
+    def __repr__(self):
+        s = sorted('{0}: {1}'.format(k, v)
+                   for k, v in zip(self.scope.names, self.slots)
+                   if v is not UNASSIGNED)
+        return "<{{{0}}} -> {1}>".format(', '.join(s), repr(self.parent))
+
+    def global_frame(self):
+        """The global environment at the root of the parent list."""
+        e = self.parent
+        while e.parent is not None:
+            e = e.parent
+        return e
+
+    def define(self, sym, val):
+        """Define Scheme symbol SYM to have value VAL in SELF, which must
+        already have a slot for SYM."""
+        names = self.scope.names
+        if sym not in names:
+            raise SchemeError("cannot define {0} here".format(str(sym)))
+        self.slots[names.index(sym)] = val
+
+# The number of the line of input on which the expression being evaluated at
+# the top level begins, or None if it is not known
+SOURCE_LINE = None
+
 class LambdaProcedure:
-    """A function defined by a lambda expression or the complex define form."""
+    """A function defined by a lambda expression or the complex define form.
+    Its line is the SOURCE_LINE when it is created: the line on which the
+    top-level form that created it begins, which is not the line of its own
+    lambda expression if that form spans several lines."""
 
-    def __init__(self, formals, body, env):
+    def __init__(self, formals, body, env, code=None, name=None):
         """A function whose formal parameter list is FORMALS (a Scheme list),
         whose body is the single Scheme expression BODY, and whose environment
         is the Frame ENV.  A lambda expression containing multiple expressions,
         such as (lambda (x) (display x) (+ x 1)) can be handled by
-        using (begin (display x) (+ x 1)) as the body."""
+        using (begin (display x) (+ x 1)) as the body.  CODE, if given, is a
+        Python function analyzed from the lambda expression that binds a list
+        of arguments in a new frame attached to ENV and evaluates BODY there.
+        It is shared by every procedure created from the same expression.
+        NAME is the symbol the procedure is defined as, if any."""
         self.formals = formals
         self.body = body
         self.env = env
+        self.code = code
+        self.name = name
+        self.line = SOURCE_LINE
 
     def __str__(self):
         return "(lambda {0} {1})".format(str(self.formals), str(self.body))
@@ -204,8 +344,16 @@ class LambdaProcedure:
 # Special forms #
 #################
 
-def do_lambda_form(vals, env):
-    """Evaluate a lambda form with parameters VALS in environment ENV."""
+# Symbols that name special forms
+AND, OR, IF, COND, BEGIN, CASE, ELSE = map(
+    Symbol, "and or if cond begin case else".split())
+LAMBDA, DEFINE, QUOTE, LET, LET_STAR = map(
+    Symbol, "lambda define quote let let*".split())
+DELAY, CONS_STREAM = map(Symbol, "delay cons-stream".split())
+
+def do_lambda_form(vals, env, name=None):
+    """Evaluate a lambda form with parameters VALS in environment ENV.  NAME
+    is the symbol the procedure is defined as, if any."""
     check_form(vals, 2)
     formals = vals[0]
     check_formals(formals)
@@ -213,8 +361,8 @@ def do_lambda_form(vals, env):
     arguments = vals.first
     body = vals.second
     if len(body)!=1:
-        return LambdaProcedure(arguments,Pair("begin",body),env)
-    return LambdaProcedure(arguments,body.first,env)
+        return LambdaProcedure(arguments,Pair(BEGIN,body),env,None,name)
+    return LambdaProcedure(arguments,body.first,env,None,name)
 
 def do_define_form(vals, env):
     """Evaluate a define form with parameters VALS in environment ENV."""
@@ -223,14 +371,22 @@ def do_define_form(vals, env):
         func_name = vals.first.first
         func_args = vals.first.second
         func_body = vals.second
-        func = do_lambda_form(Pair(func_args,func_body),env)
+        func = do_lambda_form(Pair(func_args,func_body),env,func_name)
         env.inner[func_name] = func
     else:
         rest = vals.second
-        value = scheme_eval(rest.first,env)  
+        if lambda_formp(rest.first):
+            value = do_lambda_form(rest.first.second,env,vals.first)
+        else:
+            value = scheme_eval(rest.first,env)
         env.inner[vals.first] = value
 
-def do_quote_form(vals):
+def lambda_formp(expr):
+    """Whether EXPR is a lambda form, whose value can take the name it is
+    defined as."""
+    return isinstance(expr, Pair) and expr.first == LAMBDA
+
+def do_quote_form(vals, env=None):
     """Evaluate a quote form with parameters VALS."""
     check_form(vals, 1, 1)
     return vals[0]
@@ -243,20 +399,12 @@ def do_let_form(vals, env):
     if not scheme_listp(bindings):
         raise SchemeError("bad bindings list in let form")
     # Add a frame containing bindings
-    names, vals = [], []
-    try:
-        for item in bindings:
-            name = item.first
-            names += [name]
-            vals +=[scheme_eval(item.second.first,env)]
-        new_env = env.make_call_frame(names,vals)
-    except UnboundLocalError:
-        raise SchemeError("unbound variable: "+ name)
+    new_env = Frame(env)
+    for item in bindings:
+        check_form(item, 2, 2)
+        new_env.define(item.first, scheme_eval(item.second.first, env))
     # Evaluate all but the last expression after bindings, and return the last
-    last = len(exprs)-1
-    for i in range(0, last):
-        scheme_eval(exprs[i], new_env)
-    return exprs[last], new_env
+    return eval_sequence(exprs, new_env), new_env
 
 def do_let_star_form(vals, env):
     """Evaluate a let* form with parameters VALS in environment ENV."""
@@ -266,19 +414,21 @@ def do_let_star_form(vals, env):
     if not scheme_listp(bindings):
         raise SchemeError("bad bindings list in let form")
     # Add a frame containing bindings
-    names, vals = NULL, NULL
-    "*** YOUR CODE HERE ***"
-    new_env = env.make_call_frame(names, vals)
+    new_env = Frame(env)
     for binding in bindings:
-        name = binding[0]
-        value = scheme_eval(binding[1],new_env)
-        new_env.inner[name]=value
-
+        check_form(binding, 2, 2)
+        new_env.define(binding.first, scheme_eval(binding.second.first, new_env))
     # Evaluate all but the last expression after bindings, and return the last
-    last = len(exprs)-1
-    for i in range(0, last):
-        scheme_eval(exprs[i], env)
-    return exprs[last], env
+    return eval_sequence(exprs, new_env), new_env
+
+def eval_sequence(exprs, env):
+    """Evaluate all but the last expression in the Scheme list EXPRS in
+    environment ENV, and return the last (unevaluated) so that the caller can
+    evaluate it in tail position."""
+    while exprs.second is not NULL:
+        scheme_eval(exprs.first, env)
+        exprs = exprs.second
+    return exprs.first
 
 #########################
 # Logical Special Forms #
@@ -292,24 +442,22 @@ def do_if_form(vals, env):
     result = vals.second
     if_true = result.first
     if_false = result.second.first
-    true_false = scheme_eval(condition,env)
-    if true_false:
+    if scheme_true(scheme_eval(condition, env)):
         return if_true
     else:
         return if_false
-    return NULL
 
 def do_and_form(vals, env):
     """Evaluate short-circuited and with parameters VALS in environment ENV."""
     for condition in vals:
-        if scheme_eval(condition,env)==False:
+        if not scheme_true(scheme_eval(condition, env)):
             return False
     return True
 
 def do_or_form(vals, env):
     """Evaluate short-circuited or with parameters VALS in environment ENV."""
     for condition in vals:
-        if scheme_eval(condition,env) != False:
+        if scheme_true(scheme_eval(condition, env)):
             return True
     return False
 
@@ -318,7 +466,7 @@ def do_cond_form(vals, env):
     num_clauses = len(vals)
     for i, clause in enumerate(vals):
         check_form(clause, 1)
-        if clause.first == "else":
+        if clause.first == ELSE:
             if i < num_clauses-1:
                 raise SchemeError("else must be last")
             test = True
@@ -326,42 +474,56 @@ def do_cond_form(vals, env):
                 raise SchemeError("badly formed else clause")
         else:
             test = scheme_eval(clause.first, env)
-        if test:
-            "*** YOUR CODE HERE ***"
-            if len(clause.second)>1:
-                return scheme_eval(Pair('begin',clause.second),env)
-            elif len(clause.second) == 1:
-                return scheme_eval(clause.second.first,env)
-            else:
-                return True
+        if scheme_true(test):
+            if clause.second is NULL:
+                return Pair(QUOTE, Pair(test, NULL))
+            return eval_sequence(clause.second, env)
     return None
-        
 
 def do_begin_form(vals, env):
     """Evaluate begin form with parameters VALS in environment ENV."""
     check_form(vals, 1)
-    "*** YOUR CODE HERE ***"
-    i = 0
-    length = len(vals)
-    for statement in vals:
-        i+=1
-        if i == len(vals)-1:
-            return vals[i]
-        else:
-            scheme_eval(statement,env)
-    
+    return eval_sequence(vals, env)
 
 def do_case_form(vals, env):
     """Evaluate case form with parameters VALS in environment ENV."""
     return False
 
-LOGIC_FORMS = {
-        "and": do_and_form,
-        "or": do_or_form,
-        "if": do_if_form,
-        "cond": do_cond_form,
-        "begin": do_begin_form,
-        "case": do_case_form
+def do_delay_form(vals, env):
+    """Evaluate a delay form with parameters VALS in environment ENV."""
+    check_form(vals, 1, 1)
+    expr = vals.first
+    return Promise(lambda: scheme_eval(expr, env))
+
+def do_cons_stream_form(vals, env):
+    """Evaluate a cons-stream form with parameters VALS in environment ENV:
+    a pair of the value of its first operand and a promise of its second."""
+    check_form(vals, 2, 2)
+    rest = vals.second.first
+    return Pair(scheme_eval(vals.first, env),
+                Promise(lambda: scheme_eval(rest, env)))
+
+# The special forms evaluated by scheme_eval, keyed by the Symbols that name
+# them, so that dispatch is a single dictionary probe that succeeds by identity.
+# A TAIL_FORM returns an expression to evaluate in its place, a SCOPE_FORM
+# returns such an expression and the environment in which to evaluate it, and
+# a VALUE_FORM returns its value.
+TAIL_FORM, SCOPE_FORM, VALUE_FORM = "tail", "scope", "value"
+
+SPECIAL_FORMS = {
+        AND: (TAIL_FORM, do_and_form),
+        OR: (TAIL_FORM, do_or_form),
+        IF: (TAIL_FORM, do_if_form),
+        COND: (TAIL_FORM, do_cond_form),
+        BEGIN: (TAIL_FORM, do_begin_form),
+        CASE: (TAIL_FORM, do_case_form),
+        LAMBDA: (VALUE_FORM, do_lambda_form),
+        DEFINE: (VALUE_FORM, do_define_form),
+        QUOTE: (VALUE_FORM, do_quote_form),
+        LET: (SCOPE_FORM, do_let_form),
+        LET_STAR: (SCOPE_FORM, do_let_star_form),
+        DELAY: (VALUE_FORM, do_delay_form),
+        CONS_STREAM: (VALUE_FORM, do_cons_stream_form),
         }
 
 # Utility methods for checking the structure of Scheme programs
@@ -404,6 +566,1370 @@ def check_formals(formals):
             raise SchemeError("formal arguments cannot be number")
                          
 
+############
+# Analysis #
+############
+
+# The functions below are an alternative to scheme_eval.  Rather than
+# re-examining the syntax of an expression every time it is evaluated, analyze
+# examines it once and returns a Python function that takes an environment and
+# evaluates the expression in it.
+
+class TailCall:
+    """A call to a LambdaProcedure in tail position.  Analyzed code returns
+    one of these to closure_call instead of making the call itself, so that
+    tail calls run in constant Python stack depth."""
+
+    __slots__ = ('procedure', 'args')
+
+    def __init__(self, procedure, args):
+        self.procedure = procedure
+        self.args = args
+
+def analyze(expr, scope=None, tail=False):
+    """Return a Python function that evaluates EXPR in the environment that
+    it is passed, a frame laid out by SCOPE (the global frame if SCOPE is
+    None).  If TAIL is true, EXPR is in tail position within the body of a
+    lambda, and the function may return a TailCall.
+
+    >>> code = analyze(read_line("(+ 2 2)"))
+    >>> code(create_global_frame("closure"))
+    4
+    """
+    if expr is None:
+        raise SchemeError("Cannot evaluate an undefined expression.")
+
+    # Analyze Atoms
+    if scheme_symbolp(expr):
+        return analyze_symbol(expr, scope)
+    elif scheme_atomp(expr):
+        return lambda env: expr
+
+    # Vectors evaluate to themselves; all other expressions are lists.
+    if not scheme_listp(expr):
+        if scheme_vectorp(expr):
+            return lambda env: expr
+        raise SchemeError("malformed list: {0}".format(str(expr)))
+    first, rest = expr.first, expr.second
+
+    # Analyze Combinations
+    analyze_form = ANALYZED_FORMS.get(first)
+    if analyze_form is not None:
+        return analyze_form(rest, scope, tail)
+    return analyze_application(first, rest, scope, tail)
+
+def analyze_symbol(name, scope):
+    """Analyze a reference to the variable NAME, resolving it to a slot in a
+    local frame or to the global frame."""
+    depth, scope = scope.resolve(name) if scope is not None else (0, None)
+    if scope is None:
+        def global_ref(env):
+            frame = env
+            for _ in range(depth):
+                frame = frame.parent
+            if name not in frame.inner:
+                raise SchemeError("unknown identifier: {0}".format(str(name)))
+            return frame.inner[name]
+        return global_ref
+
+    slot = scope.names.index(name)
+    if slot not in scope.defined:
+        if depth == 0:
+            return lambda env: env.slots[slot]
+        elif depth == 1:
+            return lambda env: env.parent.slots[slot]
+    def local_ref(env):
+        frame = env
+        for _ in range(depth):
+            frame = frame.parent
+        value = frame.slots[slot]
+        if value is UNASSIGNED:
+            raise SchemeError("unknown identifier: {0}".format(str(name)))
+        return value
+    return local_ref
+
+def analyze_application(operator, operands, scope, tail):
+    """Analyze the call of OPERATOR on the Scheme list OPERANDS."""
+    operator = analyze(operator, scope)
+    operands = [analyze(operand, scope) for operand in operands]
+    def application(env):
+        # The arguments are not held in a local, which would keep them alive
+        # for as long as the call and any tail calls that replace it run.
+        procedure = operator(env)
+        if tail and isinstance(procedure, LambdaProcedure):
+            return TailCall(procedure, [operand(env) for operand in operands])
+        return closure_call(procedure, [operand(env) for operand in operands],
+                            env)
+    return application
+
+def analyze_sequence(exprs, scope, tail):
+    """Analyze the non-empty Scheme list EXPRS, evaluated in order for the
+    value of the last."""
+    exprs = list(exprs)
+    init = [analyze(expr, scope) for expr in exprs[:-1]]
+    last = analyze(exprs[-1], scope, tail)
+    def sequence(env):
+        for code in init:
+            code(env)
+        return last(env)
+    return last if not init else sequence
+
+def scan_defines(exprs):
+    """The names bound by the define forms among the Scheme expressions EXPRS
+    that are evaluated in the same frame as EXPRS themselves."""
+    names = []
+    for expr in exprs:
+        if not isinstance(expr, Pair) or not scheme_listp(expr):
+            continue
+        first, rest = expr.first, expr.second
+        if first == DEFINE and rest is not NULL:
+            target = rest.first
+            names.append(target.first if isinstance(target, Pair) else target)
+        elif first in (BEGIN, IF, AND, OR):
+            names.extend(scan_defines(rest))
+        elif first == COND:
+            names.extend(scan_defines(c for c in rest if isinstance(c, Pair)))
+    return names
+
+def lambda_scope(vals, scope):
+    """Check the lambda form with parameters VALS, enclosed by SCOPE, and lay
+    out the frames its procedures create.  Returns its formals, its body as a
+    single expression, the Scope of its frames, the number of formals before
+    any rest formal, and whether there is a rest formal."""
+    check_form(vals, 2)
+    formals = vals.first
+    check_formals(formals)
+    body = vals.second
+    if len(body) != 1:
+        body = Pair(BEGIN, body)
+    else:
+        body = body.first
+
+    params, rest = [], formals
+    while isinstance(rest, Pair):
+        params.append(rest.first)
+        rest = rest.second
+    variadic = rest is not NULL
+    local = Scope(params + [rest] if variadic else params, scope)
+    for name in scan_defines([body]):
+        local.add(name, True)
+    return formals, body, local, len(params), variadic
+
+def bind_args(args, n, variadic, unassigned):
+    """The slots of a frame binding the Python list ARGS to N formals and, if
+    VARIADIC, a rest formal, followed by the list UNASSIGNED.  ARGS may be
+    reused as the result."""
+    if variadic:
+        if len(args) < n:
+            raise SchemeError("too few arguments")
+        slots = args[:n]
+        slots.append(scheme_list(*args[n:]))
+    elif len(args) != n:
+        if len(args) < n:
+            raise SchemeError("too few arguments")
+        raise SchemeError("too many arguments")
+    else:
+        slots = args
+    if unassigned:
+        slots += unassigned
+    return slots
+
+def analyze_lambda_form(vals, scope, tail, name=None):
+    """Analyze a lambda form with parameters VALS, for a procedure defined as
+    NAME if given.  Variable references in the body are resolved against a new
+    Scope holding the formal parameters and the names defined in the body."""
+    formals, body, local, n, variadic = lambda_scope(vals, scope)
+    run_body = analyze(body, local, True)
+    unassigned = [UNASSIGNED] * (len(local.names) - n - variadic)
+    def code(parent, args):
+        """Bind ARGS in a new frame attached to PARENT and run the body."""
+        slots = bind_args(args, n, variadic, unassigned)
+        return run_body(CallFrame(slots, parent, local))
+    return lambda env: LambdaProcedure(formals, body, env, code, name)
+
+def analyze_define_form(vals, scope, tail):
+    """Analyze a define form with parameters VALS."""
+    check_form(vals, 2)
+    if type(vals.first) == Pair:
+        name = vals.first.first
+        value = analyze_lambda_form(Pair(vals.first.second, vals.second),
+                                    scope, False, name)
+    elif lambda_formp(vals.second.first):
+        name = vals.first
+        value = analyze_lambda_form(vals.second.first.second, scope, False,
+                                    name)
+    else:
+        name = vals.first
+        value = analyze(vals.second.first, scope)
+    if scope is not None and name in scope.names:
+        slot = scope.names.index(name)
+        def define_local(env):
+            env.slots[slot] = value(env)
+        return define_local
+    def define(env):
+        env.define(name, value(env))
+    return define
+
+def analyze_quote_form(vals, scope, tail):
+    """Analyze a quote form with parameters VALS."""
+    value = do_quote_form(vals)
+    return lambda env: value
+
+def analyze_let_form(vals, scope, tail):
+    """Analyze a let form with parameters VALS."""
+    check_form(vals, 2)
+    bindings = vals.first
+    if not scheme_listp(bindings):
+        raise SchemeError("bad bindings list in let form")
+    for binding in bindings:
+        check_form(binding, 2, 2)
+    values = [analyze(binding.second.first, scope) for binding in bindings]
+    local = Scope([], scope)
+    slots = [local.add(binding.first) for binding in bindings]
+    for name in scan_defines(vals.second):
+        local.add(name, True)
+    body = analyze_sequence(vals.second, local, tail)
+    size = len(local.names)
+    def let(env):
+        frame = CallFrame([UNASSIGNED] * size, env, local)
+        for slot, value in zip(slots, values):
+            frame.slots[slot] = value(env)
+        return body(frame)
+    return let
+
+def analyze_let_star_form(vals, scope, tail):
+    """Analyze a let* form with parameters VALS."""
+    check_form(vals, 2)
+    bindings = vals.first
+    if not scheme_listp(bindings):
+        raise SchemeError("bad bindings list in let form")
+    local = Scope([], scope)
+    slots, values = [], []
+    for binding in bindings:
+        check_form(binding, 2, 2)
+        values.append(analyze(binding.second.first, local))
+        slots.append(local.add(binding.first))
+    for name in scan_defines(vals.second):
+        local.add(name, True)
+    body = analyze_sequence(vals.second, local, tail)
+    size = len(local.names)
+    def let_star(env):
+        frame = CallFrame([UNASSIGNED] * size, env, local)
+        for slot, value in zip(slots, values):
+            frame.slots[slot] = value(frame)
+        return body(frame)
+    return let_star
+
+def analyze_if_form(vals, scope, tail):
+    """Analyze an if form with parameters VALS."""
+    check_form(vals, 3, 3)
+    predicate = analyze(vals.first, scope)
+    consequent = analyze(vals.second.first, scope, tail)
+    alternative = analyze(vals.second.second.first, scope, tail)
+    def conditional(env):
+        if scheme_true(predicate(env)):
+            return consequent(env)
+        return alternative(env)
+    return conditional
+
+def analyze_and_form(vals, scope, tail):
+    """Analyze a short-circuited and form with parameters VALS."""
+    conditions = [analyze(condition, scope) for condition in vals]
+    def conjunction(env):
+        for condition in conditions:
+            if not scheme_true(condition(env)):
+                return False
+        return True
+    return conjunction
+
+def analyze_or_form(vals, scope, tail):
+    """Analyze a short-circuited or form with parameters VALS."""
+    conditions = [analyze(condition, scope) for condition in vals]
+    def disjunction(env):
+        for condition in conditions:
+            if scheme_true(condition(env)):
+                return True
+        return False
+    return disjunction
+
+def analyze_cond_form(vals, scope, tail):
+    """Analyze a cond form with parameters VALS."""
+    num_clauses = len(vals)
+    clauses = []
+    for i, clause in enumerate(vals):
+        check_form(clause, 1)
+        if clause.first == ELSE:
+            if i < num_clauses-1:
+                raise SchemeError("else must be last")
+            if clause.second is NULL:
+                raise SchemeError("badly formed else clause")
+            test = None
+        else:
+            test = analyze(clause.first, scope)
+        body = None
+        if clause.second is not NULL:
+            body = analyze_sequence(clause.second, scope, tail)
+        clauses.append((test, body))
+    def cond(env):
+        for test, body in clauses:
+            value = True if test is None else test(env)
+            if scheme_true(value):
+                return value if body is None else body(env)
+        return None
+    return cond
+
+def analyze_begin_form(vals, scope, tail):
+    """Analyze a begin form with parameters VALS."""
+    check_form(vals, 1)
+    return analyze_sequence(vals, scope, tail)
+
+def analyze_case_form(vals, scope, tail):
+    """Analyze a case form with parameters VALS."""
+    return lambda env: False
+
+def analyze_delay_form(vals, scope, tail):
+    """Analyze a delay form with parameters VALS."""
+    check_form(vals, 1, 1)
+    delayed = analyze(vals.first, scope)
+    return lambda env: Promise(lambda: delayed(env))
+
+def analyze_cons_stream_form(vals, scope, tail):
+    """Analyze a cons-stream form with parameters VALS."""
+    check_form(vals, 2, 2)
+    first, delayed = analyze(vals.first, scope), analyze(vals[1], scope)
+    return lambda env: Pair(first(env), Promise(lambda: delayed(env)))
+
+ANALYZED_FORMS = {
+        AND: analyze_and_form,
+        OR: analyze_or_form,
+        IF: analyze_if_form,
+        COND: analyze_cond_form,
+        BEGIN: analyze_begin_form,
+        CASE: analyze_case_form,
+        LAMBDA: analyze_lambda_form,
+        DEFINE: analyze_define_form,
+        QUOTE: analyze_quote_form,
+        LET: analyze_let_form,
+        LET_STAR: analyze_let_star_form,
+        DELAY: analyze_delay_form,
+        CONS_STREAM: analyze_cons_stream_form,
+        }
+
+def closure_eval(expr, env):
+    """Evaluate Scheme expression EXPR in environment ENV by analyzing it.
+
+    >>> closure_eval(read_line("((lambda (x) (* x x)) 3)"), create_global_frame())
+    9
+    """
+    return analyze(expr, env.scope)(env)
+
+def closure_apply(procedure, args, env):
+    """Apply scheme PROCEDURE to argument values ARGS in environment ENV,
+    running a LambdaProcedure by its analyzed body."""
+    return closure_call(procedure, list(args), env)
+
+def closure_call(procedure, arg_list, env):
+    """Apply scheme PROCEDURE to the Python list ARG_LIST in environment ENV.
+    Tail calls made by the body of a LambdaProcedure are run by looping
+    rather than recursing.
+
+    The calls of a Profiler are recorded by profiled_closure_call.  Those of
+    a SamplingProfiler are pushed on its stack here, as vm_run does, since
+    another Python call for each would cost more than the push; the stack is
+    unwound by read_eval_print after an error."""
+    stack = None
+    if PROFILER is not None:
+        if PROFILER.primitives:
+            return profiled_closure_call(procedure, arg_list, env)
+        if isinstance(procedure, LambdaProcedure) and procedure.code is not None:
+            stack = PROFILER.stack
+            stack.append(procedure)
+    while isinstance(procedure, LambdaProcedure) and procedure.code is not None:
+        result = procedure.code(procedure.env, arg_list)
+        if type(result) is not TailCall:
+            if stack is not None:
+                stack.pop()
+            return result
+        procedure, arg_list = result.procedure, result.args
+        if stack is not None:
+            stack[-1] = procedure
+    if stack is not None:
+        stack.pop()
+    if isinstance(procedure, PrimitiveProcedure):
+        return apply_primitive(procedure, arg_list, env)
+    return scheme_apply(procedure, scheme_list(*arg_list), env)
+
+############
+# Bytecode #
+############
+
+# A third evaluator compiles each expression into a flat list of instructions
+# for a stack machine.  Each instruction is a pair (opcode, argument).  Calls
+# to compiled procedures push a return record rather than recursing in Python,
+# so Scheme recursion is limited only by memory.
+
+(CONST, LOCAL, GLOBAL, STORE_LOCAL, DEFINE_NAME, POP, JUMP, JUMP_IF_FALSE,
+ JUMP_IF_TRUE, JUMP_IF_TRUE_OR_POP, CLOSURE, CALL, TAIL_CALL, RETURN,
+ ENTER, LEAVE, MAKE_PROMISE, MAKE_PAIR) = range(18)
+
+OPCODE_NAMES = ("CONST LOCAL GLOBAL STORE_LOCAL DEFINE_NAME POP JUMP "
+                "JUMP_IF_FALSE JUMP_IF_TRUE JUMP_IF_TRUE_OR_POP CLOSURE CALL "
+                "TAIL_CALL RETURN ENTER LEAVE MAKE_PROMISE MAKE_PAIR").split()
+
+class Code:
+    """The instructions compiled from the body of a lambda expression, or
+    from an expression evaluated at the top level, together with the layout
+    of the frames in which they run.  Calling a Code on an environment and a
+    list of arguments runs it in a new frame, as closure_call expects of the
+    code of a LambdaProcedure."""
+
+    __slots__ = ('instructions', 'scope', 'nparams', 'variadic', 'unassigned')
+
+    def __init__(self, scope, nparams=0, variadic=False):
+        self.instructions = []
+        self.scope = scope
+        self.nparams = nparams
+        self.variadic = variadic
+        self.unassigned = []
+
+    def emit(self, opcode, arg=None):
+        """Append an instruction, returning its index."""
+        self.instructions.append((opcode, arg))
+        return len(self.instructions) - 1
+
+    def patch(self, index):
+        """Make the jump at INDEX target the next instruction emitted."""
+        self.instructions[index] = (self.instructions[index][0],
+                                    len(self.instructions))
+
+    def bind(self, parent, args):
+        """A new frame attached to PARENT in which ARGS are bound to formals."""
+        slots = bind_args(args, self.nparams, self.variadic, self.unassigned)
+        return CallFrame(slots, parent, self.scope)
+
+    def __call__(self, parent, args):
+        return vm_run(self, self.bind(parent, args))
+
+    def __str__(self):
+        lines = []
+        for i, (opcode, arg) in enumerate(self.instructions):
+            if isinstance(arg, Code):
+                arg = "<code>"
+            elif isinstance(arg, tuple):
+                arg = " ".join(str(a) for a in arg if not isinstance(a, Scope))
+            lines.append("{0:>3} {1} {2}".format(i, OPCODE_NAMES[opcode],
+                                                 "" if arg is None else arg))
+        return "\n".join(line.rstrip() for line in lines)
+
+def compile_expr(expr, scope, tail, code):
+    """Append to CODE the instructions that push the value of EXPR, an
+    expression in a frame laid out by SCOPE.  If TAIL is true, EXPR is in tail
+    position within the body of a lambda.
+
+    >>> code = Code(None)
+    >>> compile_expr(read_line("(if (< x 0) (- x) x)"), None, False, code)
+    >>> print(code)
+      0 GLOBAL 0 <
+      1 GLOBAL 0 x
+      2 CONST 0
+      3 CALL 2
+      4 JUMP_IF_FALSE 9
+      5 GLOBAL 0 -
+      6 GLOBAL 0 x
+      7 CALL 1
+      8 JUMP 10
+      9 GLOBAL 0 x
+    """
+    if expr is None:
+        raise SchemeError("Cannot evaluate an undefined expression.")
+
+    # Compile Atoms
+    if scheme_symbolp(expr):
+        depth, binding = scope.resolve(expr) if scope is not None else (0, None)
+        if binding is None:
+            code.emit(GLOBAL, (depth, expr))
+        else:
+            code.emit(LOCAL, (depth, binding.names.index(expr), expr))
+        return
+    elif scheme_atomp(expr):
+        code.emit(CONST, expr)
+        return
+
+    # Vectors evaluate to themselves; all other expressions are lists.
+    if not scheme_listp(expr):
+        if scheme_vectorp(expr):
+            code.emit(CONST, expr)
+            return
+        raise SchemeError("malformed list: {0}".format(str(expr)))
+    first, rest = expr.first, expr.second
+
+    # Compile Combinations
+    compile_form = COMPILED_FORMS.get(first)
+    if compile_form is not None:
+        compile_form(rest, scope, tail, code)
+        return
+    compile_expr(first, scope, False, code)
+    n = 0
+    for operand in rest:
+        compile_expr(operand, scope, False, code)
+        n += 1
+    code.emit(TAIL_CALL if tail else CALL, n)
+
+def compile_sequence(exprs, scope, tail, code):
+    """Compile the non-empty Scheme list EXPRS, evaluated in order for the
+    value of the last."""
+    while exprs.second is not NULL:
+        compile_expr(exprs.first, scope, False, code)
+        code.emit(POP)
+        exprs = exprs.second
+    compile_expr(exprs.first, scope, tail, code)
+
+def compile_lambda_form(vals, scope, tail, code, name=None):
+    """Compile a lambda form with parameters VALS, for a procedure defined as
+    NAME if given."""
+    formals, body, local, n, variadic = lambda_scope(vals, scope)
+    body_code = Code(local, n, variadic)
+    compile_expr(body, local, True, body_code)
+    body_code.emit(RETURN)
+    body_code.unassigned = [UNASSIGNED] * (len(local.names) - n - variadic)
+    code.emit(CLOSURE, (body_code, formals, body, name))
+
+def compile_define_form(vals, scope, tail, code):
+    """Compile a define form with parameters VALS."""
+    check_form(vals, 2)
+    if type(vals.first) == Pair:
+        name = vals.first.first
+        compile_lambda_form(Pair(vals.first.second, vals.second), scope,
+                            False, code, name)
+    elif lambda_formp(vals.second.first):
+        name = vals.first
+        compile_lambda_form(vals.second.first.second, scope, False, code, name)
+    else:
+        name = vals.first
+        compile_expr(vals.second.first, scope, False, code)
+    if scope is not None and name in scope.names:
+        code.emit(STORE_LOCAL, scope.names.index(name))
+    else:
+        code.emit(DEFINE_NAME, name)
+    code.emit(CONST, None)
+
+def compile_quote_form(vals, scope, tail, code):
+    """Compile a quote form with parameters VALS."""
+    code.emit(CONST, do_quote_form(vals))
+
+def compile_let_form(vals, scope, tail, code):
+    """Compile a let form with parameters VALS."""
+    check_form(vals, 2)
+    bindings = vals.first
+    if not scheme_listp(bindings):
+        raise SchemeError("bad bindings list in let form")
+    local = Scope([], scope)
+    for binding in bindings:
+        check_form(binding, 2, 2)
+        compile_expr(binding.second.first, scope, False, code)
+    slots = [local.add(binding.first) for binding in bindings]
+    for name in scan_defines(vals.second):
+        local.add(name, True)
+    code.emit(ENTER, local)
+    for slot in reversed(slots):
+        code.emit(STORE_LOCAL, slot)
+    compile_sequence(vals.second, local, tail, code)
+    if not tail:
+        code.emit(LEAVE)
+
+def compile_let_star_form(vals, scope, tail, code):
+    """Compile a let* form with parameters VALS."""
+    check_form(vals, 2)
+    bindings = vals.first
+    if not scheme_listp(bindings):
+        raise SchemeError("bad bindings list in let form")
+    local = Scope([], scope)
+    code.emit(ENTER, local)
+    for binding in bindings:
+        check_form(binding, 2, 2)
+        compile_expr(binding.second.first, local, False, code)
+        code.emit(STORE_LOCAL, local.add(binding.first))
+    for name in scan_defines(vals.second):
+        local.add(name, True)
+    compile_sequence(vals.second, local, tail, code)
+    if not tail:
+        code.emit(LEAVE)
+
+def compile_if_form(vals, scope, tail, code):
+    """Compile an if form with parameters VALS."""
+    check_form(vals, 3, 3)
+    compile_expr(vals.first, scope, False, code)
+    to_alternative = code.emit(JUMP_IF_FALSE)
+    compile_expr(vals.second.first, scope, tail, code)
+    to_end = code.emit(JUMP)
+    code.patch(to_alternative)
+    compile_expr(vals.second.second.first, scope, tail, code)
+    code.patch(to_end)
+
+def compile_and_form(vals, scope, tail, code):
+    """Compile a short-circuited and form with parameters VALS."""
+    to_false = []
+    for condition in vals:
+        compile_expr(condition, scope, False, code)
+        to_false.append(code.emit(JUMP_IF_FALSE))
+    code.emit(CONST, True)
+    to_end = code.emit(JUMP)
+    for jump in to_false:
+        code.patch(jump)
+    code.emit(CONST, False)
+    code.patch(to_end)
+
+def compile_or_form(vals, scope, tail, code):
+    """Compile a short-circuited or form with parameters VALS."""
+    to_true = []
+    for condition in vals:
+        compile_expr(condition, scope, False, code)
+        to_true.append(code.emit(JUMP_IF_TRUE))
+    code.emit(CONST, False)
+    to_end = code.emit(JUMP)
+    for jump in to_true:
+        code.patch(jump)
+    code.emit(CONST, True)
+    code.patch(to_end)
+
+def compile_cond_form(vals, scope, tail, code):
+    """Compile a cond form with parameters VALS."""
+    num_clauses = len(vals)
+    to_end = []
+    for i, clause in enumerate(vals):
+        check_form(clause, 1)
+        if clause.first == ELSE:
+            if i < num_clauses-1:
+                raise SchemeError("else must be last")
+            if clause.second is NULL:
+                raise SchemeError("badly formed else clause")
+            compile_sequence(clause.second, scope, tail, code)
+            to_end.append(code.emit(JUMP))
+            continue
+        compile_expr(clause.first, scope, False, code)
+        if clause.second is NULL:
+            to_end.append(code.emit(JUMP_IF_TRUE_OR_POP))
+            continue
+        to_next = code.emit(JUMP_IF_FALSE)
+        compile_sequence(clause.second, scope, tail, code)
+        to_end.append(code.emit(JUMP))
+        code.patch(to_next)
+    code.emit(CONST, None)
+    for jump in to_end:
+        code.patch(jump)
+
+def compile_begin_form(vals, scope, tail, code):
+    """Compile a begin form with parameters VALS."""
+    check_form(vals, 1)
+    compile_sequence(vals, scope, tail, code)
+
+def compile_case_form(vals, scope, tail, code):
+    """Compile a case form with parameters VALS."""
+    code.emit(CONST, False)
+
+def compile_delayed(expr, scope):
+    """The Code computing the value of EXPR, delayed in a frame laid out by
+    SCOPE, when it is run in that frame."""
+    delayed = Code(scope)
+    compile_expr(expr, scope, False, delayed)
+    delayed.emit(RETURN)
+    return delayed
+
+def compile_delay_form(vals, scope, tail, code):
+    """Compile a delay form with parameters VALS."""
+    check_form(vals, 1, 1)
+    code.emit(MAKE_PROMISE, compile_delayed(vals.first, scope))
+
+def compile_cons_stream_form(vals, scope, tail, code):
+    """Compile a cons-stream form with parameters VALS."""
+    check_form(vals, 2, 2)
+    compile_expr(vals.first, scope, False, code)
+    code.emit(MAKE_PROMISE, compile_delayed(vals[1], scope))
+    code.emit(MAKE_PAIR)
+
+COMPILED_FORMS = {
+        AND: compile_and_form,
+        OR: compile_or_form,
+        IF: compile_if_form,
+        COND: compile_cond_form,
+        BEGIN: compile_begin_form,
+        CASE: compile_case_form,
+        LAMBDA: compile_lambda_form,
+        DEFINE: compile_define_form,
+        QUOTE: compile_quote_form,
+        LET: compile_let_form,
+        LET_STAR: compile_let_star_form,
+        DELAY: compile_delay_form,
+        CONS_STREAM: compile_cons_stream_form,
+        }
+
+def vm_run(code, env):
+    """Run the instructions of CODE in environment ENV, returning the value
+    left by its final RETURN.  Calls to compiled procedures, and their
+    returns, are recorded by the PROFILER while it is recording."""
+    instructions, pc = code.instructions, 0
+    stack, returns = [], []
+    while True:
+        opcode, arg = instructions[pc]
+        pc += 1
+        if opcode == LOCAL:
+            depth, slot, name = arg
+            frame = env
+            for _ in range(depth):
+                frame = frame.parent
+            value = frame.slots[slot]
+            if value is UNASSIGNED:
+                raise SchemeError("unknown identifier: {0}".format(str(name)))
+            stack.append(value)
+        elif opcode == GLOBAL:
+            depth, name = arg
+            frame = env
+            for _ in range(depth):
+                frame = frame.parent
+            if name not in frame.inner:
+                raise SchemeError("unknown identifier: {0}".format(str(name)))
+            stack.append(frame.inner[name])
+        elif opcode == CONST:
+            stack.append(arg)
+        elif opcode == CALL or opcode == TAIL_CALL:
+            if arg:
+                args = stack[-arg:]
+                del stack[-arg:]
+            else:
+                args = []
+            procedure = stack.pop()
+            if (isinstance(procedure, LambdaProcedure)
+                    and type(procedure.code) is Code):
+                if opcode == CALL:
+                    returns.append((instructions, pc, env))
+                    if PROFILER is not None:
+                        PROFILER.call(procedure)
+                elif PROFILER is not None:
+                    PROFILER.tail_call(procedure)
+                env = procedure.code.bind(procedure.env, args)
+                instructions, pc = procedure.code.instructions, 0
+            else:
+                stack.append(closure_call(procedure, args, env))
+        elif opcode == JUMP_IF_FALSE:
+            if not scheme_true(stack.pop()):
+                pc = arg
+        elif opcode == RETURN:
+            if not returns:
+                return stack.pop()
+            instructions, pc, env = returns.pop()
+            if PROFILER is not None:
+                PROFILER.ret()
+        elif opcode == JUMP:
+            pc = arg
+        elif opcode == POP:
+            stack.pop()
+        elif opcode == JUMP_IF_TRUE:
+            if scheme_true(stack.pop()):
+                pc = arg
+        elif opcode == JUMP_IF_TRUE_OR_POP:
+            if scheme_true(stack[-1]):
+                pc = arg
+            else:
+                stack.pop()
+        elif opcode == STORE_LOCAL:
+            env.slots[arg] = stack.pop()
+        elif opcode == DEFINE_NAME:
+            env.define(arg, stack.pop())
+        elif opcode == CLOSURE:
+            body_code, formals, body, name = arg
+            stack.append(LambdaProcedure(formals, body, env, body_code, name))
+        elif opcode == ENTER:
+            env = CallFrame([UNASSIGNED] * len(arg.names), env, arg)
+        elif opcode == LEAVE:
+            env = env.parent
+        elif opcode == MAKE_PROMISE:
+            stack.append(Promise(functools.partial(vm_run, arg, env)))
+        elif opcode == MAKE_PAIR:
+            stack[-2:] = [Pair(stack[-2], stack[-1])]
+        else:
+            raise SchemeError("bad opcode: {0}".format(opcode))
+
+def vm_eval(expr, env):
+    """Evaluate Scheme expression EXPR in environment ENV by compiling it to
+    instructions and running them.
+
+    >>> vm_eval(read_line("((lambda (x) (* x x)) 3)"), create_global_frame())
+    9
+    >>> env = create_global_frame("vm")
+    >>> vm_eval(read_line("(define (f n) (if (= n 0) 0 (+ 1 (f (- n 1)))))"), env)
+    >>> vm_eval(read_line("(f 20000)"), env)
+    20000
+    """
+    code = Code(env.scope)
+    compile_expr(expr, env.scope, False, code)
+    code.emit(RETURN)
+    return vm_run(code, env)
+
+####################
+# Constant Folding #
+####################
+
+# Expressions are simplified after they are read and before they are
+# evaluated.  A call is folded only if its operator names one of these
+# primitives, whose values depend only on their arguments.
+PURE_PRIMITIVES = frozenset([
+    scheme_booleanp, scheme_not, scheme_pairp, scheme_nullp, scheme_listp,
+    scheme_length, scheme_car, scheme_cdr, scheme_symbolp, scheme_numberp,
+    scheme_integerp, scheme_add, scheme_sub, scheme_mul, scheme_div,
+    scheme_quo, scheme_modulo, scheme_floor, scheme_ceil, scheme_eq,
+    scheme_lt, scheme_gt, scheme_le, scheme_ge, scheme_atomp, scheme_stringp,
+    scheme_string_length, scheme_string_append, scheme_substring,
+    scheme_string_eq, scheme_string_lt])
+
+def fold_constants(expr, env):
+    """Return EXPR simplified: calls to pure primitives whose operands are
+    literals are replaced by their values, if and cond forms whose conditions
+    are literals are replaced by the branches they take, and nested begin
+    forms are flattened.
+
+    An operator is folded only if the global frame of ENV binds it to a pure
+    primitive and no define, lambda, let or let* form in EXPR binds the same
+    name.  Calls that would raise an error are left to raise it when they are
+    evaluated.  Calls are not folded in the bodies of procedures or in delayed
+    expressions, which may be evaluated after the operator is redefined; only
+    their if, cond and begin forms are simplified.
+
+    >>> env = create_global_frame()
+    >>> print(fold_constants(read_line("(* x (+ 1 (car '(2 3))))"), env))
+    (* x 3)
+    >>> print(fold_constants(read_line("(if (< 2 1) (/ 1 0) (cdr '(a b)))"), env))
+    (quote (b))
+    >>> print(fold_constants(read_line("(lambda (+) (+ 1 2))"), env))
+    (lambda (+) (+ 1 2))
+    >>> print(fold_constants(read_line("(define (f) (if #t (+ 1 2) 0))"), env))
+    (define (f) (+ 1 2))
+    >>> print(fold_constants(read_line("(begin 1 (begin (f) (begin 2)))"), env))
+    (begin 1 (f) 2)
+    """
+    try:
+        return _fold(expr, binding_names(expr), env.global_frame())
+    except RecursionError:
+        return expr
+
+def binding_names(expr):
+    """The set of symbols bound by define, lambda, let and let* forms anywhere
+    in EXPR, found with an explicit stack of the expressions to search."""
+    names, stack = set(), [expr]
+    while stack:
+        expr = stack.pop()
+        if not isinstance(expr, Pair) or expr.first == QUOTE:
+            continue
+        first, rest = expr.first, expr.second
+        if isinstance(rest, Pair):
+            if first == DEFINE or first == LAMBDA:
+                names.update(_symbols_in(rest.first))
+            elif first == LET or first == LET_STAR:
+                bindings = rest.first
+                while isinstance(bindings, Pair):
+                    if isinstance(bindings.first, Pair):
+                        names.update(_symbols_in(bindings.first.first))
+                    bindings = bindings.second
+        while isinstance(expr, Pair):
+            stack.append(expr.first)
+            expr = expr.second
+    return names
+
+def _symbols_in(formals):
+    """The symbols in FORMALS, a symbol or a possibly improper list."""
+    symbols = []
+    while isinstance(formals, Pair):
+        if scheme_symbolp(formals.first):
+            symbols.append(formals.first)
+        formals = formals.second
+    if scheme_symbolp(formals):
+        symbols.append(formals)
+    return symbols
+
+def _fold(expr, bound, frame):
+    """Fold EXPR, in which the names in BOUND may not refer to the bindings
+    in FRAME, the global frame.  FRAME is None if the evaluation of EXPR is
+    deferred, in which case no calls are folded."""
+    if not isinstance(expr, Pair) or not scheme_listp(expr):
+        return expr
+    first, rest = expr.first, expr.second
+    if first == QUOTE:
+        return expr
+    elif first == IF:
+        return _fold_if(expr, bound, frame)
+    elif first == COND:
+        return _fold_cond(expr, bound, frame)
+    elif first == BEGIN:
+        return _fold_begin(expr, bound, frame)
+    elif first in (LAMBDA, DEFINE) and rest is not NULL:
+        if first == LAMBDA or isinstance(rest.first, Pair):
+            frame = None # A procedure body is evaluated when it is called
+        body = _fold_all(rest.second, bound, frame)
+        if body is rest.second:
+            return expr
+        return Pair(first, Pair(rest.first, body))
+    elif first == DELAY:
+        return Pair(first, _fold_all(rest, bound, None))
+    elif first == CONS_STREAM and rest is not NULL:
+        operand = _fold(rest.first, bound, frame)
+        return Pair(first, Pair(operand, _fold_all(rest.second, bound, None)))
+    elif first in (LET, LET_STAR) and rest is not NULL:
+        bindings = rest.first
+        if scheme_listp(bindings):
+            bindings = _fold_all(bindings, bound, frame, _fold_binding)
+        body = _fold_all(rest.second, bound, frame)
+        if bindings is rest.first and body is rest.second:
+            return expr
+        return Pair(first, Pair(bindings, body))
+    elif first in SPECIAL_FORMS:
+        return Pair(first, _fold_all(rest, bound, frame))
+
+    # Combinations
+    expr = _fold_all(expr, bound, frame)
+    first, operands = expr.first, expr.second
+    if frame is None or not scheme_symbolp(first) or first in bound:
+        return expr
+    procedure = frame.inner.get(first)
+    if (not isinstance(procedure, PrimitiveProcedure) or procedure.use_env
+            or procedure.fn not in PURE_PRIMITIVES):
+        return expr
+    args = []
+    for operand in operands:
+        if not _literalp(operand):
+            return expr
+        args.append(_literal_value(operand))
+    try:
+        value = procedure.fn(*args)
+    except (SchemeError, ArithmeticError, TypeError, ValueError):
+        return expr
+    return expr if value is None else _literal(value)
+
+def _fold_all(exprs, bound, frame, fold=None):
+    """Fold each element of the Scheme list EXPRS with FOLD (default _fold),
+    returning EXPRS itself if no element changes."""
+    fold = fold or _fold
+    folded = [fold(expr, bound, frame) for expr in exprs]
+    for new, old in zip(folded, exprs):
+        if new is not old:
+            return scheme_list(*folded)
+    return exprs
+
+def _fold_binding(binding, bound, frame):
+    """Fold the expression in BINDING, a (name expression) list of a let."""
+    if not scheme_listp(binding) or len(binding) != 2:
+        return binding
+    value = _fold(binding.second.first, bound, frame)
+    if value is binding.second.first:
+        return binding
+    return Pair(binding.first, Pair(value, NULL))
+
+def _fold_if(expr, bound, frame):
+    """Fold an if form EXPR, replacing it by one branch if its condition is a
+    literal."""
+    if len(expr) != 4:
+        return expr
+    expr = Pair(IF, _fold_all(expr.second, bound, frame))
+    condition, branches = expr.second.first, expr.second.second
+    if not _literalp(condition):
+        return expr
+    if scheme_true(_literal_value(condition)):
+        return branches.first
+    return branches.second.first
+
+def _fold_cond(expr, bound, frame):
+    """Fold a cond form EXPR.  Clauses whose tests are false literals are
+    dropped, and a clause whose test is a true literal ends the form."""
+    clauses, last = [], len(expr.second) - 1
+    for i, clause in enumerate(expr.second):
+        if not isinstance(clause, Pair) or not scheme_listp(clause):
+            return expr
+        test, body = clause.first, _fold_all(clause.second, bound, frame)
+        if test == ELSE:
+            if body is NULL or i < last:
+                return expr
+            test = True
+        else:
+            test = _fold(test, bound, frame)
+        if _literalp(test):
+            if not scheme_true(_literal_value(test)):
+                continue
+            if not clauses:
+                return test if body is NULL else _sequence(body)
+            if body is not NULL:
+                test = ELSE
+            clauses.append(Pair(test, body))
+            break
+        clauses.append(Pair(test, body))
+    return Pair(COND, scheme_list(*clauses))
+
+def _fold_begin(expr, bound, frame):
+    """Fold a begin form EXPR, splicing in the expressions of nested begin
+    forms."""
+    if expr.second is NULL:
+        return expr
+    exprs = []
+    for e in _fold_all(expr.second, bound, frame):
+        if isinstance(e, Pair) and e.first == BEGIN and e.second is not NULL:
+            exprs.extend(e.second)
+        else:
+            exprs.append(e)
+    return _sequence(scheme_list(*exprs))
+
+def _sequence(exprs):
+    """An expression that evaluates the non-empty Scheme list EXPRS in
+    order."""
+    if exprs.second is NULL:
+        return exprs.first
+    return Pair(BEGIN, exprs)
+
+def _literalp(expr):
+    """Whether EXPR is a literal: a quotation or a self-evaluating value."""
+    if isinstance(expr, Pair):
+        return expr.first == QUOTE and scheme_listp(expr) and len(expr) == 2
+    return expr is not None and not scheme_symbolp(expr)
+
+def _literal_value(expr):
+    """The value of the literal EXPR."""
+    if isinstance(expr, Pair):
+        return expr.second.first
+    return expr
+
+def _literal(value):
+    """A literal expression whose value is VALUE."""
+    if isinstance(value, Pair) or scheme_symbolp(value):
+        return Pair(QUOTE, Pair(value, NULL))
+    return value
+
+#############
+# Profiling #
+#############
+
+# While PROFILER is a Profiler or a SamplingProfiler, the evaluators report
+# the procedure calls they make to it: call when a procedure is applied,
+# tail_call when a tail call replaces the running procedure, and ret when the
+# procedure returns.  Calls to primitives are reported only if the primitives
+# attribute of the profiler is true.
+PROFILER = None
+
+class Profiler:
+    """A deterministic profiler of calls to Scheme procedures.
+
+    For each procedure name, stats holds [calls, self time, total time].  Only
+    the outermost of the active calls to a recursive procedure adds to its
+    total time.  The self time spent in each stack of calls is kept in a tree
+    of nodes [children, self time], in which children maps each name called to
+    a node, so that it can be written as collapsed stacks.
+
+    >>> ticks = iter(range(100))
+    >>> profiler = Profiler(lambda: next(ticks))
+    >>> f = LambdaProcedure(NULL, 1, None, name='f')
+    >>> g = PrimitiveProcedure(None, name='g')
+    >>> profiler.call(f); profiler.call(g); profiler.ret(); profiler.ret()
+    >>> profiler.stats
+    {'g': [1, 1, 1], 'f': [1, 2, 3]}
+    >>> profiler.write_collapsed(sys.stdout)
+    f 2000000
+    f;g 1000000
+    """
+    primitives = True
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.stats = {}
+        self.root = [{}, 0]
+        self.stack = []   # [name, node, start, time in calls] for each call
+        self.active = {}  # The number of active calls, by name
+
+    def call(self, procedure):
+        """Record the start of a call to PROCEDURE."""
+        name = procedure_name(procedure)
+        parent = self.stack[-1][1] if self.stack else self.root
+        node = parent[0].get(name)
+        if node is None:
+            node = parent[0][name] = [{}, 0]
+        self.active[name] = self.active.get(name, 0) + 1
+        self.stack.append([name, node, self.clock(), 0])
+
+    def ret(self):
+        """Record the return of the innermost active call."""
+        if not self.stack:
+            return
+        name, node, start, inner = self.stack.pop()
+        elapsed = self.clock() - start
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = [0, 0, 0]
+        stats[0] += 1
+        stats[1] += elapsed - inner
+        node[1] += elapsed - inner
+        self.active[name] -= 1
+        if not self.active[name]:
+            stats[2] += elapsed
+        if self.stack:
+            self.stack[-1][3] += elapsed
+
+    def tail_call(self, procedure):
+        """Record a tail call to PROCEDURE replacing the innermost call."""
+        self.ret()
+        self.call(procedure)
+
+    def unwind(self, depth):
+        """Record the return of all but the outermost DEPTH active calls,
+        which an error has ended."""
+        while len(self.stack) > depth:
+            self.ret()
+
+    def stop(self):
+        """Stop recording.  Calls are recorded as they are made, so there is
+        nothing to finish."""
+
+    def report(self, file=None):
+        """Print the calls, self time and total time of each procedure to FILE
+        (default sys.stdout), in decreasing order of self time."""
+        file = file or sys.stdout
+        row = "{0:>10} {1:>10} {2:>10}  {3}"
+        print(row.format("calls", "self", "total", "procedure"), file=file)
+        by_self_time = sorted(self.stats.items(), key=lambda item: -item[1][1])
+        for name, (calls, self_time, total) in by_self_time:
+            print(row.format(calls, "{0:.6f}".format(self_time),
+                             "{0:.6f}".format(total), name), file=file)
+
+    def write_collapsed(self, file):
+        """Write the self time of each stack of calls to FILE as collapsed
+        stacks, which flame graph tools read: one line per stack, holding the
+        names called separated by semicolons and the time in microseconds.
+        Stacks in which less than half a microsecond was spent are omitted."""
+        lines, nodes = [], [((), self.root)]
+        while nodes:
+            names, (children, self_time) = nodes.pop()
+            microseconds = round(self_time * 1000000)
+            if microseconds:
+                lines.append("{0} {1}".format(";".join(names), microseconds))
+            for name, child in children.items():
+                nodes.append((names + (name,), child))
+        for line in sorted(lines):
+            print(line, file=file)
+
+# The number of seconds between the samples taken by a SamplingProfiler
+SAMPLE_INTERVAL = 0.005
+
+class SamplingProfiler:
+    """A statistical profiler that samples the stack of Scheme procedures
+    running at regular intervals.
+
+    The evaluators report calls to a SamplingProfiler as they do to a
+    Profiler, except for calls to primitives, but it only keeps the procedures
+    active in stack, a list in which each call is pushed and popped.  A
+    background thread copies the stack every INTERVAL seconds.  Procedures are
+    reported by name and the line of the top-level form that created them, if
+    it is known; the time spent in primitives counts as time spent in their
+    callers.
+
+    >>> profiler = SamplingProfiler(interval=3600)
+    >>> f = LambdaProcedure(NULL, 1, None, name='f')
+    >>> g = LambdaProcedure(NULL, 2, None, name='g')
+    >>> profiler.call(f); profiler.call(f); profiler.tail_call(g)
+    >>> [procedure_name(p) for p in profiler.stack]
+    ['f', 'g']
+    >>> profiler.unwind(0); profiler.stop(); profiler.stack
+    []
+    """
+    primitives = False
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stack = []    # The procedures active, outermost first
+        self.call = self.stack.append
+        self.samples = {}  # The number of samples of each stack, as a tuple
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self._run, daemon=True)
+        self._sampler.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            stack = tuple(self.stack)
+            self.samples[stack] = self.samples.get(stack, 0) + 1
+
+    def ret(self):
+        """Record the return of the innermost active call."""
+        if self.stack:
+            self.stack.pop()
+
+    def tail_call(self, procedure):
+        """Record a tail call to PROCEDURE replacing the innermost call."""
+        if self.stack:
+            self.stack[-1] = procedure
+        else:
+            self.stack.append(procedure)
+
+    def unwind(self, depth):
+        """Record the return of all but the outermost DEPTH active calls,
+        which an error has ended."""
+        del self.stack[depth:]
+
+    def stop(self):
+        """Stop sampling."""
+        self._stopped.set()
+        self._sampler.join()
+
+    def named_samples(self):
+        """A dict from each stack sampled, as a tuple of names, to the number
+        of samples taken of it."""
+        names, named = {}, {}
+        for stack, count in self.samples.items():
+            for procedure in stack:
+                if procedure not in names:
+                    names[procedure] = sample_name(procedure)
+            key = tuple(names[procedure] for procedure in stack)
+            named[key] = named.get(key, 0) + count
+        return named
+
+    def report(self, file=None):
+        """Print to FILE (default sys.stdout) a histogram of the percentage of
+        samples in which each procedure was running itself (self) and was
+        active at all (total), in decreasing order of self samples."""
+        file = file or sys.stdout
+        named = self.named_samples()
+        total = sum(named.values())
+        self_counts, total_counts = {}, {}
+        for stack, count in named.items():
+            if stack:
+                self_counts[stack[-1]] = self_counts.get(stack[-1], 0) + count
+            for name in set(stack):
+                total_counts[name] = total_counts.get(name, 0) + count
+        row = "{0:>10} {1:>7} {2:>7}  {3}"
+        print(row.format("samples", "self", "total", "procedure"), file=file)
+        by_self = sorted(total_counts, key=lambda n: -self_counts.get(n, 0))
+        for name in by_self:
+            count = self_counts.get(name, 0)
+            print(row.format(count, "{0:.1%}".format(count / total),
+                             "{0:.1%}".format(total_counts[name] / total),
+                             name), file=file)
+        print("{0} samples, one every {1} seconds".format(total, self.interval),
+              file=file)
+
+    def write_collapsed(self, file):
+        """Write the number of samples of each stack to FILE as collapsed
+        stacks, which flame graph tools read."""
+        named = self.named_samples()
+        for stack in sorted(named):
+            if stack:
+                print("{0} {1}".format(";".join(stack), named[stack]),
+                      file=file)
+
+def sample_name(procedure):
+    """The name under which samples of PROCEDURE are reported: its profiled
+    name, followed by the line of the top-level form that created it if that
+    is known.  A procedure created within a form that spans several lines is
+    reported at the form's first line.
+
+    >>> f = LambdaProcedure(NULL, 1, None, name='f')
+    >>> f.line = 3
+    >>> sample_name(f), sample_name(PrimitiveProcedure(None, name='g'))
+    ('f (form at line 3)', 'g')
+    """
+    name = procedure_name(procedure)
+    line = getattr(procedure, "line", None)
+    if line is None:
+        return name
+    return "{0} (form at line {1})".format(name, line)
+
+def procedure_name(procedure):
+    """The name under which calls to PROCEDURE are profiled."""
+    name = getattr(procedure, "name", None)
+    if name is not None:
+        return str(name)
+    elif isinstance(procedure, LambdaProcedure):
+        return lambda_name(procedure.formals)
+    elif isinstance(procedure, PrimitiveProcedure):
+        return procedure.fn.__name__
+    return str(procedure)
+
+def lambda_name(formals):
+    """The name under which calls to anonymous procedures with parameters
+    FORMALS are profiled."""
+    return "(lambda {0})".format("()" if formals is NULL else formals)
+
+def profiled_apply(procedure, args, env):
+    """Apply PROCEDURE to ARGS as scheme_apply does, recording the call."""
+    profiler = PROFILER
+    profiler.call(procedure)
+    try:
+        if isinstance(procedure, LambdaProcedure):
+            frame = procedure.env.make_call_frame(procedure.formals, args)
+            return scheme_eval(procedure.body, frame, True)
+        elif isinstance(procedure, PrimitiveProcedure):
+            return apply_primitive(procedure, list(args), env)
+        raise SchemeError("Cannot call {0}".format(repr(procedure)))
+    finally:
+        profiler.ret()
+
+def profiled_closure_call(procedure, arg_list, env):
+    """Apply PROCEDURE to ARG_LIST as closure_call does, recording the call
+    and the tail calls that replace it."""
+    profiler = PROFILER
+    profiler.call(procedure)
+    try:
+        while (isinstance(procedure, LambdaProcedure)
+               and procedure.code is not None):
+            result = procedure.code(procedure.env, arg_list)
+            if type(result) is not TailCall:
+                return result
+            procedure, arg_list = result.procedure, result.args
+            profiler.tail_call(procedure)
+        if isinstance(procedure, PrimitiveProcedure):
+            return apply_primitive(procedure, arg_list, env)
+        return scheme_apply(procedure, scheme_list(*arg_list), env)
+    finally:
+        profiler.ret()
+
+def start_profiler(profiler_class):
+    """Stop the profiler that is running, if any, and start a new one of
+    PROFILER_CLASS, either Profiler or SamplingProfiler."""
+    global PROFILER
+    stop_profiler()
+    PROFILER = profiler_class()
+
+def stop_profiler():
+    """Stop the profiler that is running and return it, or None if there is
+    none."""
+    global PROFILER
+    profiler = PROFILER
+    PROFILER = None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+def scheme_profile_start(mode=None):
+    """Start profiling, by sampling the procedures running if MODE is the
+    symbol sample and by recording every call otherwise."""
+    if mode is None:
+        start_profiler(Profiler)
+    elif mode == "sample":
+        start_profiler(SamplingProfiler)
+    else:
+        raise SchemeError("unknown profiler mode: {0}".format(str(mode)))
+
+def _check_file_name(name, val):
+    """Check that the argument VAL of NAME names a file, as a symbol or a
+    string, returning the name."""
+    if scheme_stringp(val):
+        return val.text
+    return check_type(val, scheme_symbolp, 0, name)
+
+def scheme_profile_report(path=None):
+    """Stop profiling and print the procedures profiled.  If PATH is given,
+    also write their stacks to the file PATH, a symbol or a string, as
+    collapsed stacks."""
+    profiler = stop_profiler()
+    if profiler is None:
+        raise SchemeError("the profiler is not running")
+    OUTPUT_PORT.flush()
+    profiler.report()
+    if path is not None:
+        path = _check_file_name("profile-report", path)
+        with open(path, "w") as output:
+            profiler.write_collapsed(output)
+
 ################
 # Input/Output #
 ################
@@ -411,78 +1937,308 @@ def check_formals(formals):
 def scheme_read(input_port):
     """Read the next expression from INPUT_PORT, a buffer.Buffer.
 
+    Lists and quotations that enclose the current position are kept on an
+    explicit stack rather than in recursive calls, so that long or deeply
+    nested input can be read.  Each entry is a pair (kind, elements): kind is
+    "(" for a list, "#(" for a vector, "." for the remainder of a list
+    following a dot, and "'" for a quotation awaiting its expression.
+
     >>> scheme_read(Buffer(tokenize_lines(["(1", "2 .", "'(3 4))", "4"])))
     Pair(1, Pair(2, Pair('quote', Pair(Pair(3, Pair(4, NULL)), NULL))))
+    >>> scheme_read(Buffer(tokenize_lines(["#(1 (2) #())"])))
+    Vector([1, Pair(2, NULL), Vector([])])
     """
-    def read_tail():
-        """Assuming that input is positioned inside a Scheme list or pair,
-        immediately before a final parenthesis or another item in the list,
-        return the remainder of the list from that point.  Thus, returns
-        (2 3) when positioned at the carat in "(1 ^ 2 3)", returns nil when
-        positioned at the carat in "(1 2 3 ^ )", and returns the pair (2 . 3)
-        when positioned at the carat in (1 ^ 2 . 3).
-        """
-        if input_port.current() is None:
-            raise SchemeError("unexpected end of file")
-        if input_port.current() == ')':
+    stack = []
+    while True:
+        val = input_port.current()
+        if stack and stack[-1][0] != "'" and val in (None, ")", "."):
+            if val is None:
+                raise SchemeError("unexpected end of file")
             input_port.pop()
-            return NULL
-        if input_port.current() == ".":
+            if val == ".":
+                if stack[-1][0] == "#(":
+                    raise SchemeError("unexpected token: .")
+                stack.append((".", []))
+                continue
+            # Close the innermost vector, or list and any dotted remainders
+            # it ends
+            kind, elements = stack.pop()
+            if kind == "#(":
+                expr = Vector(elements)
+            else:
+                expr = NULL
+                while True:
+                    for element in reversed(elements):
+                        expr = Pair(element, expr)
+                    if kind == "(":
+                        break
+                    if not isinstance(expr, Pair) or len(expr) != 1:
+                        raise SchemeError("too many elements in pair")
+                    expr = expr.first
+                    kind, elements = stack.pop()
+        elif val is None:
+            expr = EOF
+        else:
             input_port.pop()
-            a = read_tail()
-            if len(a)!=1:
-                raise SchemeError("too many elements in pair")
-            return a.first
-        result = Pair(scheme_read(input_port),read_tail())
-        return result
-
-    if input_port.current() is None:
-        return EOF
-    val = input_port.pop()
-    if scheme_atomp(val) and val not in DELIMITERS:
-        return val
-    elif val == "'":
-        return Pair("quote", Pair(scheme_read(input_port), NULL))
-    elif val == "(":
-        return read_tail()
-    else:
-        raise SchemeError("unexpected token: {0}".format(val))
+            if scheme_atomp(val) and val not in DELIMITERS:
+                expr = val
+            elif val == "'":
+                stack.append(("'", None))
+                continue
+            elif val == "(":
+                stack.append(("(", []))
+                continue
+            elif val == "#(":
+                stack.append(("#(", []))
+                continue
+            else:
+                raise SchemeError("unexpected token: {0}".format(val))
+
+        # Place the expression just read in its enclosing form
+        while stack and stack[-1][0] == "'":
+            stack.pop()
+            expr = Pair(QUOTE, Pair(expr, NULL))
+        if not stack:
+            return expr
+        stack[-1][1].append(expr)
+
+class InputPort:
+    """A Scheme input port from which the reader reads expressions, through a
+    Buffer of the tokens in the lines of text LINES."""
+
+    __slots__ = ('buffer',)
+
+    def __init__(self, lines):
+        self.buffer = Buffer(tokenize_lines(lines))
+
+    def __str__(self):
+        return "#[input-port]"
+
+def scheme_input_portp(x):
+    return isinstance(x, InputPort)
+
+def scheme_open_input_string(s):
+    """An input port reading the expressions written in the string S."""
+    check_type(s, scheme_stringp, 0, "open-input-string")
+    return InputPort(s.text.splitlines())
+
+def scheme_read_port(port):
+    """The next expression read from the input port PORT, or EOF.
+
+    >>> port = scheme_open_input_string(String("(a 1) b"))
+    >>> [scheme_read_port(port) for _ in range(3)]
+    [Pair('a', Pair(1, NULL)), 'b', EOF]
+    """
+    check_type(port, scheme_input_portp, 0, "read")
+    return scheme_read(port.buffer)
+
+def read_form(input_port):
+    """The next expression read from INPUT_PORT, a buffer.Buffer, or EOF,
+    and the number of the line on which it begins."""
+    input_port.current()
+    line = input_port.line_count
+    return scheme_read(input_port), line
 
-def read_eval_print(input_port, prompt, env, print_input):
+def read_eval_print(input_port, prompt, env, print_input, read=read_form):
     """Read and evaluate from the current input port until the end of file.
     If PROMPT is not None, use it to prompt for input and print values of
-    each expression."""
-    while True:
-        try:
-            if prompt is not None:
-                print(prompt, end = "")
-            sys.stdout.flush()
-            expr = scheme_read(input_port)
-            if expr is EOF:
-                return
-            if print_input:
-                print(expr)
-            val = scheme_eval(expr, env)
-            if prompt is not None and val is not None:
-                scheme_display(val)
-                scheme_newline()
-        except SchemeError as exc:
-            if not exc.args[0]:
-                print("Error", file=sys.stderr)
-            else:
-                print("Error: {0}".format(exc.args[0]), file=sys.stderr)
-            sys.stderr.flush()
+    each expression.  READ returns the next expression from INPUT_PORT, or
+    EOF, and the number of the line on which it begins (None if unknown),
+    which is the SOURCE_LINE while the expression is evaluated.  Output is
+    flushed before each prompt, before each error message, and when the loop
+    ends."""
+    global SOURCE_LINE
+    evaluate = env.global_frame().evaluator
+    outer_line = SOURCE_LINE
+    try:
+        while True:
+            depth = len(PROFILER.stack) if PROFILER is not None else 0
+            try:
+                if prompt is not None:
+                    OUTPUT_PORT.write(prompt)
+                    OUTPUT_PORT.flush()
+                expr, SOURCE_LINE = read(input_port)
+                if expr is EOF:
+                    return
+                if print_input:
+                    scheme_write(expr)
+                    scheme_newline()
+                val = evaluate(fold_constants(expr, env), env)
+                if prompt is not None and val is not None:
+                    scheme_write(val)
+                    scheme_newline()
+            except SchemeError as exc:
+                if PROFILER is not None:
+                    PROFILER.unwind(depth)
+                OUTPUT_PORT.flush()
+                if not exc.args[0]:
+                    print("Error", file=sys.stderr)
+                else:
+                    print("Error: {0}".format(exc.args[0]), file=sys.stderr)
+                sys.stderr.flush()
+    finally:
+        SOURCE_LINE = outer_line
+        OUTPUT_PORT.flush()
 
 def scheme_load(sym, env):
-    """Load Scheme source file SYM."""
-    check_type(sym, scheme_symbolp, 0, "load")
-    with scheme_open(filename) as inp:
-        scheme_repl(inp, "", env.global_frame(), False)
+    """Load Scheme source file SYM, named by a symbol or a string.  The
+    expressions in the file are read from the cache written by
+    read_cached_forms when it is up to date.
+
+    >>> import tempfile
+    >>> env = create_global_frame()
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     path = os.path.join(tmp, "square.scm")
+    ...     with open(path, "w") as f:
+    ...         _ = f.write("(define (square x) (* x x))\\n")
+    ...     scheme_load(String(path), env)
+    >>> scheme_eval(read_line("(square 3)"), env)
+    9
+    """
+    with scheme_open(_check_file_name("load", sym)) as inp:
+        forms = read_cached_forms(inp)
+        if forms is None:
+            scheme_repl(inp, "", env.global_frame(), False)
+        else:
+            read_eval_print(iter(forms), "", env.global_frame(), False,
+                            lambda forms: next(forms, (EOF, None)))
+
+# Expressions read from a source file are cached in this directory next to it.
+# Change FORMS_CACHE_VERSION whenever the representation of expressions does.
+FORMS_CACHE_DIR = "__scmcache__"
+FORMS_CACHE_VERSION = 5
+
+def forms_cache_path(path):
+    """The path of the cache of expressions read from the source file PATH."""
+    directory, name = os.path.split(os.path.abspath(path))
+    name = "{0}.v{1}.pickle".format(name, FORMS_CACHE_VERSION)
+    return os.path.join(directory, FORMS_CACHE_DIR, name)
+
+def read_cached_forms(source_file):
+    """The list of expressions in SOURCE_FILE, an open file, each paired with
+    the number of the line on which it begins.  If the cache at
+    forms_cache_path was written for the file's current path, modification
+    time and size by this version of the interpreter, the expressions are
+    loaded from it; otherwise they are read from the file and cached.
+    Returns None, with SOURCE_FILE positioned at its start, if the file
+    cannot be read without error.  A file with invalid tokens is not cached,
+    so that their warnings are printed each time it is read.
+
+    >>> import io, tempfile
+    >>> from contextlib import redirect_stderr
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     path = os.path.join(tmp, "double.scm")
+    ...     with open(path, "w") as f:
+    ...         _ = f.write("(define (double x) (* 2 x))\\n(double 21)\\n")
+    ...     with open(path) as f:
+    ...         first = read_cached_forms(f)
+    ...     with open(path) as f:
+    ...         second = read_cached_forms(f)
+    ...     os.path.exists(forms_cache_path(path))
+    True
+    >>> [(str(expr), line) for expr, line in second]
+    [('(define (double x) (* 2 x))', 1), ('(double 21)', 2)]
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     path = os.path.join(tmp, "invalid.scm")
+    ...     with open(path, "w") as f:
+    ...         _ = f.write("(double `21)\\n")
+    ...     with open(path) as f, redirect_stderr(io.StringIO()) as errors:
+    ...         forms = read_cached_forms(f)
+    ...     cached = os.path.exists(forms_cache_path(path))
+    >>> errors.getvalue().split(":")[0], cached
+    ('warning', False)
+    """
+    path = os.path.abspath(source_file.name)
+    stat = os.fstat(source_file.fileno())
+    key = (path, stat.st_mtime_ns, stat.st_size, FORMS_CACHE_VERSION)
+    cache = forms_cache_path(path)
+    try:
+        with open(cache, "rb") as f:
+            cached_key, forms = pickle.load(f)
+        if cached_key == key:
+            return forms
+    except Exception:
+        pass # A missing, stale, or unreadable cache is replaced below
+
+    buf = Buffer(tokenize_lines(source_file))
+    forms, warnings = [], warning_count()
+    try:
+        expr, line = read_form(buf)
+        while expr is not EOF:
+            forms.append((expr, line))
+            expr, line = read_form(buf)
+    except SchemeError:
+        source_file.seek(0)
+        return None
+    if warning_count() != warnings:
+        return forms
+
+    temporary = "{0}.{1}.tmp".format(cache, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        with open(temporary, "wb") as f:
+            pickle.dump((key, forms), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, cache)
+    except (OSError, pickle.PicklingError, RecursionError):
+        pass # Caching is an optimization; the forms were read regardless
+    return forms
 
 def scheme_repl(source, prompt, env, print_input=True):
     """Start a read-eval-print loop reading from SOURCE."""
     read_eval_print(Buffer(tokenize_lines(source)), prompt, env, print_input)
 
+# The number of characters read at a time from a stream of Scheme source
+STREAM_CHUNK_SIZE = 1 << 16
+
+def read_chunks(source_file, size=STREAM_CHUNK_SIZE):
+    """An iterator over the text of SOURCE_FILE, an open file or pipe, read
+    SIZE characters at a time."""
+    return iter(functools.partial(source_file.read, size), "")
+
+def mmap_chunks(path, size=STREAM_CHUNK_SIZE, encoding="utf-8"):
+    """An iterator over the text of the file at PATH, decoded from ENCODING
+    SIZE bytes at a time from a memory map of the file.  Only the chunk being
+    decoded is copied out of the map, so the file is never read into memory
+    as a whole.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     path = os.path.join(tmp, "text.scm")
+    ...     with open(path, "w", encoding="utf-8") as f:
+    ...         _ = f.write('(display "\u00e9t\u00e9")\\n')
+    ...     list(mmap_chunks(path, size=11))
+    ['(display "', '\u00e9t\u00e9")\\n']
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return # An empty file cannot be mapped
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for start in range(0, len(data), size):
+                text = decoder.decode(data[start:start + size])
+                if text:
+                    yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+def scheme_eval_stream(chunks, env, prompt=None, print_input=False):
+    """Read and evaluate each expression in CHUNKS, an iterable of strings of
+    Scheme source that may break anywhere, including within a line or an
+    expression.  Chunks are tokenized as they are read, and expressions are
+    evaluated as soon as they have been read and then discarded, so the
+    memory used does not grow with the length of the source, or of any line
+    in it.  As in read_eval_print, values are printed only if PROMPT
+    is not None.
+
+    >>> env = create_global_frame()
+    >>> scheme_eval_stream(["(define (square x)", " (* x x))\\n(display (squ",
+    ...                     "are 12))\\n(newline)"], env)
+    144
+    """
+    buf = Buffer(tokenize_chunks(chunks))
+    read_eval_print(buf, prompt, env, print_input)
+
 def scheme_open(filename):
     """If either FILENAME or FILENAME.scm is the name of a valid file,
     return a Python file opened to it. Otherwise, raise an error."""
@@ -500,17 +2256,117 @@ def read_line(line):
     """Read a single string LINE as a Scheme expression."""
     return scheme_read(Buffer(tokenize_lines([line])))
 
-def create_global_frame():
-    """Initialize and return a single-frame environment with built-in names."""
+EVALUATORS = {
+        "tree": (scheme_eval, scheme_apply),
+        "closure": (closure_eval, closure_apply),
+        "vm": (vm_eval, closure_apply),
+        }
+
+def create_global_frame(evaluator="tree"):
+    """Initialize and return a single-frame environment with built-in names.
+    EVALUATOR names the entry of EVALUATORS used to evaluate expressions in
+    the environment: "tree" walks the syntax of each expression as it is
+    evaluated, "closure" analyzes it into Python functions first, and "vm"
+    compiles it to instructions for a stack machine."""
+    if evaluator not in EVALUATORS:
+        raise SchemeError("unknown evaluator: {0}".format(evaluator))
+    eval_fn, apply_fn = EVALUATORS[evaluator]
     env = Frame(None)
-    env.define("eval", PrimitiveProcedure(scheme_eval, True))
-    env.define("apply", PrimitiveProcedure(scheme_apply, True))
-    env.define("load", PrimitiveProcedure(scheme_load, True))
+    env.evaluator, env.applier = eval_fn, apply_fn
+    env.define(Symbol("eval"), PrimitiveProcedure(eval_fn, True, "eval"))
+    env.define(Symbol("apply"), PrimitiveProcedure(apply_fn, True, "apply"))
+    env.define(Symbol("load"), PrimitiveProcedure(scheme_load, True, "load"))
+    env.define(Symbol("profile-start"),
+               PrimitiveProcedure(scheme_profile_start, False, "profile-start"))
+    env.define(Symbol("profile-report"),
+               PrimitiveProcedure(scheme_profile_report, False,
+                                  "profile-report"))
+    env.define(Symbol("input-port?"),
+               PrimitiveProcedure(scheme_input_portp, False, "input-port?"))
+    env.define(Symbol("open-input-string"),
+               PrimitiveProcedure(scheme_open_input_string, False,
+                                  "open-input-string"))
+    env.define(Symbol("read"), PrimitiveProcedure(scheme_read_port, False,
+                                                  "read"))
     add_primitives(env)
     return env
 
+def parse_evaluator(argv):
+    """Remove an --evaluator=NAME option from the command line arguments ARGV,
+    returning the evaluator NAME (default "tree") and the other arguments."""
+    evaluator, rest = "tree", []
+    for arg in argv:
+        if arg.startswith("--evaluator="):
+            evaluator = arg[len("--evaluator="):]
+        else:
+            rest.append(arg)
+    if evaluator not in EVALUATORS:
+        print("unknown evaluator: {0}".format(evaluator), file=sys.stderr)
+        sys.exit(1)
+    return evaluator, rest
+
+def parse_options(argv, options):
+    """Remove options --KEY=VALUE from the command line arguments ARGV for
+    each KEY in the dict OPTIONS, which is updated with their values.  Returns
+    the other arguments.
+
+    >>> options = {"jobs": "1"}
+    >>> parse_options(["--jobs=4", "--other=1", "tests.scm"], options)
+    ['--other=1', 'tests.scm']
+    >>> options
+    {'jobs': '4'}
+    """
+    rest = []
+    for arg in argv:
+        key, equals, value = arg[2:].partition("=")
+        if arg.startswith("--") and equals and key in options:
+            options[key] = value
+        else:
+            rest.append(arg)
+    return rest
+
+def parse_profile(argv):
+    """Remove a --profile[=PATH] or --profile-sample[=PATH] option from the
+    command line arguments ARGV.  Returns the class of profiler to run (a
+    Profiler for --profile, a SamplingProfiler for --profile-sample, or None
+    if neither is given), the PATH to which collapsed stacks are written
+    (default PROFILE_PATH), and the other arguments."""
+    options = {"--profile": Profiler, "--profile-sample": SamplingProfiler}
+    profiler, path, rest = None, PROFILE_PATH, []
+    for arg in argv:
+        option, _, value = arg.partition("=")
+        if option in options:
+            profiler = options[option]
+            path = value or PROFILE_PATH
+        else:
+            rest.append(arg)
+    return profiler, path, rest
+
+PROFILE_PATH = "profile.folded"
+
+def parse_stream(argv):
+    """Remove a --stream or --stream=mmap option from the command line
+    arguments ARGV.  Returns "read" for --stream, which reads the input
+    STREAM_CHUNK_SIZE characters at a time, "mmap" for --stream=mmap, which
+    maps the input file into memory instead, or None if neither is given,
+    and the other arguments."""
+    stream, rest = None, []
+    for arg in argv:
+        option, equals, value = arg.partition("=")
+        if option == "--stream" and value in ("", "mmap"):
+            stream = value or "read"
+        else:
+            rest.append(arg)
+    return stream, rest
+
 @main
 def run(*argv):
+    evaluator, argv = parse_evaluator(argv)
+    profiler, profile_path, argv = parse_profile(argv)
+    stream, argv = parse_stream(argv)
+    if stream == "mmap" and not argv:
+        print("--stream=mmap needs an input file", file=sys.stderr)
+        sys.exit(1)
     if argv:
         try:
             input_file = open(argv[0])
@@ -523,4 +2379,24 @@ def run(*argv):
         input_file = sys.stdin
         print_input = False
 
-    scheme_repl(input_file, "scm> ", create_global_frame(), print_input)
+    if profiler is not None:
+        start_profiler(profiler)
+    try:
+        if stream == "mmap":
+            input_file.close()
+            scheme_eval_stream(mmap_chunks(argv[0]),
+                               create_global_frame(evaluator))
+        elif stream == "read":
+            scheme_eval_stream(read_chunks(input_file),
+                               create_global_frame(evaluator))
+        else:
+            scheme_repl(input_file, "scm> ", create_global_frame(evaluator),
+                        print_input)
+    finally:
+        profiler = stop_profiler() if profiler is not None else None
+        if profiler is not None:
+            profiler.report(sys.stderr)
+            with open(profile_path, "w") as output:
+                profiler.write_collapsed(output)
+            print("collapsed stacks written to {0}".format(profile_path),
+                  file=sys.stderr)
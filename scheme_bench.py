@@ -0,0 +1,170 @@
+"""Benchmarks for the Scheme interpreter.
+
+Usage: python3 scheme_bench.py [--evaluator=NAME] [--runs=N] [--output=FILE]
+                               [--baseline=FILE] [--threshold=T] [NAME ...]
+
+Runs each Scheme program in the benchmarks directory (or only the programs
+NAME.scm) in a new global frame, and reports the best time of N runs (default
+3).  One more run is traced to report the peak memory allocated, the number of
+memory blocks it allocated that are still in use when it ends, and the number
+of garbage collections it caused.  A program whose first lines contain the
+comment "; repeat: K" is read K times in a row, with each {i} in it replaced
+by the number of the repetition, which makes a long input of varied tokens
+out of a short file.
+
+The --output option writes the results to FILE as JSON.  The --baseline option
+compares the results with those saved in FILE by an earlier run, and exits with
+status 1 if the time or peak memory of any benchmark grew by more than the
+fraction T (default 0.1).
+"""
+
+import gc
+import io
+import json
+import os
+import platform
+import re
+import sys
+import time
+import tracemalloc
+from contextlib import redirect_stdout, redirect_stderr
+from ucb import main
+from scheme import (scheme_repl, create_global_frame, parse_evaluator,
+                    parse_options)
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "benchmarks")
+
+REPEAT = re.compile(r";\s*repeat:\s*(\d+)")
+
+def read_benchmark(path):
+    """The lines of the benchmark program in the file PATH, repeated as its
+    repeat comment asks, with each {i} replaced by the number of the
+    repetition.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     path = os.path.join(tmp, "vary.scm")
+    ...     with open(path, "w") as f:
+    ...         _ = f.write("; repeat: 3\\n'(x{i} 1.5{i})\\n")
+    ...     read_benchmark(path)[1::2]
+    ["'(x0 1.50)\\n", "'(x1 1.51)\\n", "'(x2 1.52)\\n"]
+    """
+    with open(path) as f:
+        lines = f.readlines()
+    for line in lines:
+        if not line.startswith(";"):
+            break
+        match = REPEAT.match(line)
+        if match:
+            return [line.replace("{i}", str(i))
+                    for i in range(int(match.group(1))) for line in lines]
+    return lines
+
+def run_benchmark(lines, evaluator):
+    """Evaluate the Scheme source LINES in a new global frame, returning the
+    seconds taken and the errors printed."""
+    env = create_global_frame(evaluator)
+    errors = io.StringIO()
+    with redirect_stdout(io.StringIO()), redirect_stderr(errors):
+        start = time.perf_counter()
+        scheme_repl(lines, None, env, False)
+        elapsed = time.perf_counter() - start
+    return elapsed, errors.getvalue()
+
+def trace_benchmark(lines, evaluator):
+    """Evaluate LINES as run_benchmark does, returning the peak memory traced
+    in bytes, the number of blocks allocated that are still in use, and the
+    number of garbage collections."""
+    gc.collect()
+    collections = sum(gen["collections"] for gen in gc.get_stats())
+    tracemalloc.start()
+    try:
+        run_benchmark(lines, evaluator)
+        peak = tracemalloc.get_traced_memory()[1]
+        blocks = sum(stat.count for stat in
+                     tracemalloc.take_snapshot().statistics("filename"))
+    finally:
+        tracemalloc.stop()
+    collections = sum(gen["collections"] for gen in gc.get_stats()) - collections
+    return peak, blocks, collections
+
+def benchmark(path, evaluator, runs):
+    """Run the benchmark in the file PATH, returning a dict of its results."""
+    lines = read_benchmark(path)
+    times = []
+    for _ in range(runs):
+        elapsed, errors = run_benchmark(lines, evaluator)
+        if errors:
+            raise RuntimeError(errors.splitlines()[0])
+        times.append(elapsed)
+    peak, blocks, collections = trace_benchmark(lines, evaluator)
+    return {"time": min(times), "peak_memory": peak, "blocks": blocks,
+            "collections": collections}
+
+def find_regressions(results, baseline, threshold):
+    """Lines describing each benchmark in RESULTS whose time or peak memory
+    exceeds that in BASELINE by more than the fraction THRESHOLD.
+
+    >>> old = {"fib": {"time": 1.0, "peak_memory": 100}}
+    >>> new = {"fib": {"time": 1.5, "peak_memory": 105}, "new": {}}
+    >>> find_regressions(new, old, 0.1)
+    ['fib: time 1 -> 1.5 (+50%)']
+    """
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        for key in ("time", "peak_memory"):
+            old, new = baseline[name][key], results[name][key]
+            if old and new > old * (1 + threshold):
+                regressions.append("{0}: {1} {2:.4g} -> {3:.4g} ({4:+.0%})"
+                                   .format(name, key, old, new, new / old - 1))
+    return regressions
+
+@main
+def run_benchmarks(*argv):
+    """Run the benchmarks named on the command line, or all of them."""
+    evaluator, argv = parse_evaluator(argv)
+    options = {"runs": "3", "output": None, "baseline": None,
+               "threshold": "0.1"}
+    names = parse_options(argv, options)
+    if not names:
+        names = sorted(f[:-len(".scm")] for f in os.listdir(BENCHMARK_DIR)
+                       if f.endswith(".scm"))
+
+    results = {}
+    row = "{0:<12} {1:>10} {2:>12} {3:>10} {4:>12}"
+    print(row.format("benchmark", "time (s)", "peak (KiB)", "blocks",
+                     "collections"))
+    for name in names:
+        path = os.path.join(BENCHMARK_DIR, name + ".scm")
+        try:
+            result = benchmark(path, evaluator, int(options["runs"]))
+        except (OSError, RuntimeError) as exc:
+            print("{0}: {1}".format(name, exc), file=sys.stderr)
+            sys.exit(1)
+        results[name] = result
+        print(row.format(name, "{0:.4f}".format(result["time"]),
+                         "{0:.1f}".format(result["peak_memory"] / 1024),
+                         result["blocks"], result["collections"]))
+
+    if options["output"] is not None:
+        with open(options["output"], "w") as f:
+            json.dump({"evaluator": evaluator,
+                       "python": platform.python_version(),
+                       "benchmarks": results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+    if options["baseline"] is not None:
+        with open(options["baseline"]) as f:
+            baseline = json.load(f)
+        if baseline.get("evaluator") != evaluator:
+            print("warning: the baseline was run with the {0} evaluator"
+                  .format(baseline.get("evaluator")), file=sys.stderr)
+        regressions = find_regressions(results, baseline["benchmarks"],
+                                       float(options["threshold"]))
+        for line in regressions:
+            print("regression in " + line)
+        if regressions:
+            sys.exit(1)
+        print("no regressions from {0}".format(options["baseline"]))
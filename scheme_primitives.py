@@ -3,8 +3,14 @@
 In addition to the types defined in this file, some data types in Scheme are
 represented by their corresponding type in Python:
     number:       int or float
-    symbol:       string
+    symbol:       Symbol, an interned string
+    string:       String
     boolean:      bool
+    vector:       Vector
+    hash table:   HashTable
+    promise:      Promise
+    output port:  OutputPort
+    input port:   scheme.InputPort
     unspecified:  None
 
 The __repr__ method of a Scheme value will return a Python expression that
@@ -16,13 +22,21 @@ would be read to the value, where possible.
 
 import math
 import operator
+import re
 import sys
+from array import array
+from collections import OrderedDict
 
 try:
     import turtle
 except:
     print("warning: could not import the turtle module.", file=sys.stderr)
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 #################
 # Scheme Values #
@@ -31,36 +45,152 @@ except:
 class SchemeError(BaseException):
     """Exception indicating an error in a Scheme program."""
 
+class Symbol(str):
+    """A Scheme symbol.  Symbols are interned: there is only one Symbol with a
+    given name, so symbols can be compared by identity.  A Symbol is equal to
+    (and hashes like) the string of its name.
+
+    >>> Symbol('x') is Symbol('x')
+    True
+    >>> Symbol('x') == 'x'
+    True
+    """
+    __slots__ = ()
+    _table = {}
+
+    def __new__(cls, name):
+        symbol = cls._table.get(name)
+        if symbol is None:
+            symbol = cls._table[name] = str.__new__(cls, name)
+        return symbol
+
+class String:
+    """A Scheme string, whose characters are the Python str TEXT.  Strings
+    cannot be changed, and are equal (and hash alike) when their text is.
+    Unlike a Symbol, a String is not a str.
+
+    >>> s = String('say "hi"')
+    >>> print(s)
+    "say \\"hi\\""
+    >>> s == String('say "hi"'), s == 'say "hi"'
+    (True, False)
+    """
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+    def __eq__(self, other):
+        return type(other) is String and self.text == other.text
+
+    def __hash__(self):
+        return hash((String, self.text))
+
+    def __str__(self):
+        text = self.text.replace('\\', '\\\\').replace('"', '\\"')
+        return '"{0}"'.format(text.replace('\n', '\\n').replace('\t', '\\t'))
+
+    def __repr__(self):
+        return "String({0})".format(repr(self.text))
+
 class Pair:
     """A pair has two elements, first and rest.  If the Pair is a well-formed
     list, rest is either a list or NULL.  Some methods only apply to lists.
+
+    The length of the list starting at each Pair is computed at most once and
+    cached, so Pairs must not be given a new second element after they have
+    been measured.  Scheme programs cannot mutate pairs; Python code should
+    only assign to second while building a new list.
+
+    >>> s = Pair(1, Pair(2, Pair(3, NULL)))
+    >>> len(s), len(s.second), scheme_listp(s), scheme_listp(Pair(1, 2))
+    (3, 2, True, False)
     """
+    __slots__ = ('first', 'second', '_length')
+
     def __init__(self, first, second):
         self.first = first
         self.second = second
+        self._length = None
 
     def __repr__(self):
-        return "Pair({0}, {1})".format(repr(self.first), repr(self.second))
+        """A Python expression for SELF.  Nested Pairs are written using an
+        explicit stack of (pair, whether its first element is written)."""
+        parts, stack, y = [], [], self
+        while True:
+            while isinstance(y, Pair):
+                parts.append("Pair(")
+                stack.append((y, False))
+                y = y.first
+            parts.append(repr(y))
+            while stack:
+                p, first_written = stack.pop()
+                if first_written:
+                    parts.append(")")
+                else:
+                    parts.append(", ")
+                    stack.append((p, True))
+                    y = p.second
+                    break
+            else:
+                return "".join(parts)
 
     def __str__(self):
-        s = "(" + str(self.first)
-        second = self.second
-        while isinstance(second, Pair):
-            s += " " + str(second.first)
-            second = second.second
-        if second is not NULL:
-            s += " . " + str(second)
-        return s + ")"
+        """A Scheme expression for SELF.  Nested lists are written using an
+        explicit stack of the rest of each enclosing list.
+
+        >>> print(Pair(1, Pair(Pair(2, Pair(3, NULL)), Pair(4, 5))))
+        (1 (2 3) 4 . 5)
+        """
+        parts, stack, y = ["("], [], self
+        while True:
+            element = y.first
+            if isinstance(element, Pair):
+                parts.append("(")
+                stack.append(y.second)
+                y = element
+                continue
+            parts.append(str(element))
+            rest = y.second
+            while not isinstance(rest, Pair):
+                if rest is not NULL:
+                    parts.append(" . ")
+                    parts.append(str(rest))
+                parts.append(")")
+                if not stack:
+                    return "".join(parts)
+                rest = stack.pop()
+            parts.append(" ")
+            y = rest
 
     def __len__(self):
-        n, second = 1, self.second
-        while isinstance(second, Pair):
-            n += 1
-            second = second.second
-        if second is not NULL:
+        n = self._length
+        if n is None:
+            n = self._measure()
+        if n < 0:
             raise SchemeError("length attempted on improper list")
         return n
 
+    def _measure(self):
+        """Cache the length of the list starting at each Pair from SELF up to
+        the first Pair already measured, and return the length for SELF.  The
+        length of an improper list is -1."""
+        pairs, y = [], self
+        while isinstance(y, Pair) and y._length is None:
+            pairs.append(y)
+            y = y.second
+        if y is NULL:
+            n = 0
+        elif isinstance(y, Pair):
+            n = y._length
+        else:
+            n = -1
+        for p in reversed(pairs):
+            if n >= 0:
+                n += 1
+            p._length = n
+        return n
+
     def __getitem__(self, k):
         if k < 0:
             raise SchemeError("negative index into list")
@@ -79,13 +209,30 @@ class Pair:
             yield y.first
             y = y.second
 
+    def __reduce__(self):
+        """Pickle a list as its elements, so that long lists do not recurse."""
+        elements, y = [], self
+        while isinstance(y, Pair):
+            elements.append(y.first)
+            y = y.second
+        return (_unpickle_list, (elements, y))
+
     def map(self, fn):
         """Return a Scheme list after mapping Python function FN to SELF."""
-        mapped = fn(self.first)
-        if self.second is NULL or isinstance(self.second, Pair):
-            return Pair(mapped, self.second.map(fn))
-        else:
+        result = last = Pair(fn(self.first), NULL)
+        y = self.second
+        while isinstance(y, Pair):
+            last.second = Pair(fn(y.first), NULL)
+            last, y = last.second, y.second
+        if y is not NULL:
             raise SchemeError("ill-formed list")
+        return result
+
+def _unpickle_list(elements, rest):
+    """The list of the Python list ELEMENTS, followed by REST."""
+    for element in reversed(elements):
+        rest = Pair(element, rest)
+    return rest
 
 class NULL:
     """The empty list"""
@@ -96,6 +243,9 @@ class NULL:
     def __repr__(self):
         return "NULL"
 
+    def __reduce__(self):
+        return "NULL"
+
     def __len__(self):
         return 0
 
@@ -121,8 +271,306 @@ class EOF:
     def __repr__(self):
         return "EOF"
 
+    def __reduce__(self):
+        return "EOF"
+
 EOF = EOF()
 
+# Homogeneous vectors of ints or floats are stored in arrays with these codes.
+_ARRAY_TYPECODES = {int: 'q', float: 'd'}
+_ARRAY_ELEMENT_TYPES = {'q': int, 'd': float}
+
+class Vector:
+    """A Scheme vector: a sequence of fixed length with constant-time access
+    to each element.  A vector whose elements are all ints that fit in 64 bits
+    or all floats is stored compactly in an array; storing an element of any
+    other type converts the storage to a list.
+
+    >>> v = Vector([1, 2, 3])
+    >>> v.items
+    array('q', [1, 2, 3])
+    >>> v[1] = 2.5
+    >>> v.items
+    [1, 2.5, 3]
+    >>> print(v)
+    #(1 2.5 3)
+    """
+    __slots__ = ('items',)
+
+    def __init__(self, items):
+        self.items = _vector_storage(list(items))
+
+    def __str__(self):
+        return "#(" + " ".join(str(item) for item in self.items) + ")"
+
+    def __repr__(self):
+        return "Vector({0})".format(repr(list(self.items)))
+
+    def __reduce__(self):
+        return (Vector, (list(self.items),))
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, k):
+        return self.items[k]
+
+    def __setitem__(self, k, value):
+        items = self.items
+        if type(items) is not list:
+            if type(value) is _ARRAY_ELEMENT_TYPES[items.typecode]:
+                try:
+                    items[k] = value
+                    return
+                except OverflowError:
+                    pass
+            items = self.items = items.tolist()
+        items[k] = value
+
+    def __iter__(self):
+        return iter(self.items)
+
+def _vector_storage(values):
+    """An array holding the Python list VALUES if they are all ints that fit
+    in 64 bits or all floats, and otherwise VALUES itself."""
+    if values:
+        kind = type(values[0])
+        if kind in _ARRAY_TYPECODES and all(type(v) is kind for v in values):
+            try:
+                return array(_ARRAY_TYPECODES[kind], values)
+            except OverflowError:
+                pass
+    return values
+
+class HashTable:
+    """A Scheme hash table, mapping keys to values.  Keys are compared with
+    equal?, except that atoms of different types are different keys, so #t,
+    1 and 1.0 are three keys.  Lists, vectors and numbers are entered in the
+    underlying dict as EqualKeys.  A vector must not be changed while it is a
+    key.
+
+    >>> table = HashTable()
+    >>> table[Pair(1, Pair(2, NULL))] = 'a'
+    >>> table[Pair(1, Pair(2, NULL))]
+    'a'
+    >>> table[1], table[True] = 'int', 'bool'
+    >>> table[1.0] = 'float'
+    >>> table[1], table[True], len(table)
+    ('int', 'bool', 4)
+    >>> print(table)
+    #[hash-table 4]
+    """
+    __slots__ = ('entries',)
+
+    def __init__(self):
+        self.entries = {}
+
+    def __str__(self):
+        return "#[hash-table {0}]".format(len(self.entries))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return _hash_key(key) in self.entries
+
+    def __getitem__(self, key):
+        return self.entries[_hash_key(key)]
+
+    def __setitem__(self, key, value):
+        self.entries[_hash_key(key)] = value
+
+    def __delitem__(self, key):
+        self.entries.pop(_hash_key(key), None)
+
+    def items(self):
+        """A list of the (key, value) pairs in SELF."""
+        return [(key.value if type(key) is EqualKey else key, value)
+                for key, value in self.entries.items()]
+
+class EqualKey:
+    """A hashable stand-in for a list, vector or number VALUE that is equal
+    to the EqualKey of any value equal? to VALUE whose atoms have the same
+    types as those of VALUE."""
+    __slots__ = ('value', 'hash')
+
+    def __init__(self, value):
+        self.value = value
+        self.hash = _equal_hash(value)
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        return (type(other) is EqualKey and self.hash == other.hash and
+                _same_key(self.value, other.value))
+
+def _hash_key(x):
+    """The key under which X is entered in the dict of a HashTable."""
+    if isinstance(x, (Pair, Vector, int, float)):
+        return EqualKey(x)
+    return x
+
+def _same_key(x, y):
+    """Whether X and Y are equal? and their atoms have the same types.
+    Nested lists and vectors are compared with an explicit stack.
+
+    >>> _same_key(Pair(1, NULL), Pair(1, NULL)), _same_key(1, True)
+    (True, False)
+    >>> _same_key(Vector([1, 2]), Vector([1, 2.0]))
+    False
+    """
+    stack = [(x, y)]
+    while stack:
+        x, y = stack.pop()
+        if isinstance(x, Pair):
+            if not isinstance(y, Pair):
+                return False
+            stack.append((x.second, y.second))
+            stack.append((x.first, y.first))
+        elif isinstance(x, Vector):
+            if not isinstance(y, Vector) or len(x.items) != len(y.items):
+                return False
+            stack.extend(zip(x.items, y.items))
+        elif type(x) is not type(y) or not scheme_eqp(x, y):
+            return False
+    return True
+
+def _equal_hash(x):
+    """A hash of X that is the same for all values that _same_key finds the
+    same as X.  Nested lists and vectors are traversed with an explicit
+    stack."""
+    h, stack = 0, [x]
+    while stack:
+        y = stack.pop()
+        if isinstance(y, Pair):
+            h = hash((h, Pair))
+            stack.append(y.second)
+            stack.append(y.first)
+        elif isinstance(y, Vector):
+            h = hash((h, Vector, len(y.items)))
+            stack.extend(reversed(y.items))
+        else:
+            h = hash((h, type(y), y))
+    return h
+
+class Promise:
+    """A value whose computation is delayed until it is forced.  THUNK, a
+    Python function of no arguments, computes the value when the Promise is
+    first forced.  The Promise then keeps the value and drops THUNK, and with
+    it the environment in which the computation was delayed.
+
+    >>> calls = []
+    >>> promise = Promise(lambda: calls.append(1) or len(calls))
+    >>> promise.force(), promise.force(), calls
+    (1, 1, [1])
+    """
+    __slots__ = ('thunk', 'value')
+
+    def __init__(self, thunk):
+        self.thunk = thunk
+        self.value = None
+
+    def __str__(self):
+        return "#[promise]"
+
+    def force(self):
+        """The value of the Promise, computed at most once."""
+        thunk = self.thunk
+        if thunk is not None:
+            value = thunk()
+            if self.thunk is not None: # THUNK may have forced the Promise
+                self.thunk, self.value = None, value
+        return self.value
+
+# The number of characters an OutputPort holds before writing them out
+OUTPUT_BUFFER_SIZE = 8192
+
+class OutputPort:
+    """A Scheme output port writing to the Python text file FILE, or to
+    sys.stdout as it is when the port is flushed if FILE is None.  Text is
+    held until SIZE characters are waiting or the port is flushed, except that
+    a newline written to an interactive terminal is shown at once.
+
+    >>> port = OutputPort()
+    >>> port.write("hello"); port.newline()
+    >>> port.flush()
+    hello
+    """
+    __slots__ = ('file', 'size', 'parts', 'pending', '_file', '_tty')
+
+    def __init__(self, file=None, size=OUTPUT_BUFFER_SIZE):
+        self.file = file
+        self.size = size
+        self.parts = []
+        self.pending = 0  # The number of characters in parts
+        self._file = self._tty = None  # The last file checked by interactive
+
+    def __str__(self):
+        return "#[output-port]"
+
+    def write(self, text):
+        """Write the string TEXT to the port."""
+        self.parts.append(text)
+        self.pending += len(text)
+        if self.pending >= self.size:
+            self.flush()
+
+    def newline(self):
+        """End the current line, which is flushed if the port is
+        interactive."""
+        self.write("\n")
+        if self.interactive():
+            self.flush()
+
+    def interactive(self):
+        """Whether the port writes to a terminal."""
+        file = self.file or sys.stdout
+        if file is not self._file:
+            try:
+                self._tty = file.isatty()
+            except (AttributeError, ValueError):
+                self._tty = False
+            self._file = file
+        return self._tty
+
+    def flush(self):
+        """Write out the text held by the port and flush its file."""
+        file = self.file or sys.stdout
+        if self.parts:
+            text = "".join(self.parts)
+            self.parts, self.pending = [], 0
+            file.write(text)
+        file.flush()
+
+class StringOutputPort(OutputPort):
+    """An output port that keeps the text written to it in memory.
+
+    >>> port = StringOutputPort()
+    >>> port.write("a"); port.newline(); port.write("b")
+    >>> port.getvalue()
+    'a\\nb'
+    """
+    __slots__ = ()
+
+    def __init__(self):
+        OutputPort.__init__(self, size=math.inf)
+
+    def interactive(self):
+        return False
+
+    def flush(self):
+        """The text written to a string port is never written out."""
+
+    def getvalue(self):
+        """All the text written to the port."""
+        text = "".join(self.parts)
+        self.parts = [text]
+        return text
+
+# The port to which display and newline write by default
+OUTPUT_PORT = OutputPort()
+
 ########################
 # Primitive Operations #
 ########################
@@ -130,18 +578,57 @@ EOF = EOF()
 class PrimitiveProcedure:
     """A Scheme procedure defined as a Python function."""
 
-    def __init__(self, fn, use_env=False):
+    def __init__(self, fn, use_env=False, name=None):
         self.fn = fn
         self.use_env = use_env
+        self.name = name
+
+class MemoizedProcedure(PrimitiveProcedure):
+    """A Scheme procedure that caches the values returned by PROCEDURE, keyed
+    on its arguments as compared by equal?.  At most SIZE values are kept, and
+    the least recently used value is evicted first.  PROCEDURE is applied by
+    the evaluator of the calling environment.
+
+    Arguments are not copied, so a vector passed as an argument must not be
+    changed while its call is cached."""
+
+    def __init__(self, procedure, size):
+        PrimitiveProcedure.__init__(self, self.call, True,
+                                    getattr(procedure, "name", None))
+        self.procedure = procedure
+        self.size = size
+        self.cache = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def call(self, *args):
+        """Return the value of PROCEDURE on ARGS, followed by the calling
+        environment, computing it only if it is not cached."""
+        env, args = args[-1], args[:-1]
+        key = tuple(map(_hash_key, args))
+        cache = self.cache
+        if key in cache:
+            self.hits += 1
+            cache.move_to_end(key)
+            return cache[key]
+        self.misses += 1
+        apply = env.global_frame().applier
+        value = apply(self.procedure, scheme_list(*args), env)
+        cache[key] = value
+        if len(cache) > self.size:
+            cache.popitem(last=False)
+            self.evictions += 1
+        return value
 
 _PRIMITIVES = []
 
-def primitive(*names):
-    """An annotation to convert a Python function into a PrimitiveProcedure."""
+def primitive(*names, use_env=False):
+    """An annotation to convert a Python function into a PrimitiveProcedure.
+    If USE_ENV is true, the function is passed the calling environment as a
+    final argument."""
     def add(fn):
-        proc = PrimitiveProcedure(fn)
+        proc = PrimitiveProcedure(fn, use_env, names[0])
         for name in names:
-            _PRIMITIVES.append((name,proc))
+            _PRIMITIVES.append((Symbol(name),proc))
         return fn
     return add
 
@@ -172,8 +659,37 @@ def scheme_not(x):
 
 @primitive("eq?")
 def scheme_eqp(x, y):
+    if type(x) is Symbol and type(y) is Symbol:
+        return x is y
     return x == y
 
+@primitive("equal?")
+def scheme_equalp(x, y):
+    """Whether X and Y are eq?, or are lists or vectors with equal? elements.
+    Nested lists and vectors are compared with an explicit stack.
+
+    >>> s = Pair(1, Pair(Vector([2, 3]), NULL))
+    >>> scheme_equalp(s, Pair(1, Pair(Vector([2, 3]), NULL)))
+    True
+    >>> scheme_equalp(s, Pair(1, Pair(Vector([2]), NULL)))
+    False
+    """
+    stack = [(x, y)]
+    while stack:
+        x, y = stack.pop()
+        if isinstance(x, Pair):
+            if not isinstance(y, Pair):
+                return False
+            stack.append((x.second, y.second))
+            stack.append((x.first, y.first))
+        elif isinstance(x, Vector):
+            if not isinstance(y, Vector) or len(x.items) != len(y.items):
+                return False
+            stack.extend(zip(x.items, y.items))
+        elif not scheme_eqp(x, y):
+            return False
+    return True
+
 @primitive("pair?")
 def scheme_pairp(x):
     return isinstance(x, Pair)
@@ -185,11 +701,12 @@ def scheme_nullp(x):
 @primitive("list?")
 def scheme_listp(x):
     """Return whether x is a well-formed list. Assumes no cycles."""
-    while x is not NULL:
-        if not isinstance(x, Pair):
-            return False
-        x = x.second
-    return True
+    if isinstance(x, Pair):
+        n = x._length
+        if n is None:
+            n = x._measure()
+        return n >= 0
+    return x is NULL
 
 @primitive("length")
 def scheme_length(x):
@@ -237,6 +754,272 @@ def scheme_append(*vals):
             result = r
     return result
 
+@primitive("vector?")
+def scheme_vectorp(x):
+    return isinstance(x, Vector)
+
+@primitive("make-vector")
+def scheme_make_vector(k, fill=0):
+    check_type(k, lambda k: isinstance(k, int) and k >= 0, 0, "make-vector")
+    return Vector([fill] * k)
+
+@primitive("vector")
+def scheme_vector(*vals):
+    return Vector(vals)
+
+def _check_vector_index(v, k, name):
+    """Check that V is a vector and K an index of one of its elements."""
+    check_type(v, scheme_vectorp, 0, name)
+    check_type(k, lambda k: isinstance(k, int), 1, name)
+    if not 0 <= k < len(v):
+        raise SchemeError("vector index {0} out of bounds".format(k))
+
+@primitive("vector-ref")
+def scheme_vector_ref(v, k):
+    _check_vector_index(v, k, "vector-ref")
+    return v.items[k]
+
+@primitive("vector-set!")
+def scheme_vector_set(v, k, value):
+    _check_vector_index(v, k, "vector-set!")
+    v[k] = value
+
+@primitive("vector-length")
+def scheme_vector_length(v):
+    check_type(v, scheme_vectorp, 0, "vector-length")
+    return len(v.items)
+
+@primitive("vector->list")
+def scheme_vector_to_list(v):
+    check_type(v, scheme_vectorp, 0, "vector->list")
+    return scheme_list(*v.items)
+
+@primitive("list->vector")
+def scheme_list_to_vector(x):
+    check_type(x, scheme_listp, 0, "list->vector")
+    return Vector(x)
+
+##
+## Bulk numeric vector operations (non-standard)
+##
+
+# These run through NumPy when it is available and the vectors are stored in
+# arrays.  Sums and products of int arrays stay in Python, since NumPy would
+# overflow silently where Scheme integers do not.  Float overflow gives inf
+# without a warning, as it does in Python, but sums of floats computed by NumPy
+# may differ from those computed in Python in the last place.
+_NUMPY_DTYPES = {'q': 'int64', 'd': 'float64'}
+
+def _numpy_view(v, *typecodes):
+    """A NumPy array sharing the storage of vector V, or None if NumPy is not
+    available or V is not stored in an array with one of TYPECODES."""
+    items = v.items
+    if numpy is None or type(items) is list or items.typecode not in typecodes:
+        return None
+    return numpy.frombuffer(items, dtype=_NUMPY_DTYPES[items.typecode])
+
+def _vector_of_array(items):
+    """A Vector whose storage is the array ITEMS."""
+    v = Vector.__new__(Vector)
+    v.items = items
+    return v
+
+def _check_num_vector(v, k, name):
+    """Check that V, argument K of NAME, is a vector of numbers."""
+    check_type(v, scheme_vectorp, k, name)
+    if type(v.items) is list:
+        _check_nums(*v.items)
+
+def _check_num_vectors(v, w, name):
+    """Check that V and W are vectors of numbers of the same length."""
+    _check_num_vector(v, 0, name)
+    _check_num_vector(w, 1, name)
+    if len(v.items) != len(w.items):
+        raise SchemeError("{0}: vectors differ in length".format(name))
+
+def _scheme_number(x):
+    """The number X as a Scheme value: whole floats become ints, as they do in
+    the results of arithmetic primitives."""
+    x = x.item() if numpy is not None and isinstance(x, numpy.generic) else x
+    if type(x) is float and x.is_integer():
+        return int(x)
+    return x
+
+@primitive("vector-add")
+def scheme_vector_add(v, w):
+    _check_num_vectors(v, w, "vector-add")
+    x, y = _numpy_view(v, 'd'), _numpy_view(w, 'd')
+    if x is not None and y is not None:
+        with numpy.errstate(all="ignore"):
+            return _vector_of_array(array('d', (x + y).tobytes()))
+    return Vector(map(operator.add, v.items, w.items))
+
+@primitive("vector-mul")
+def scheme_vector_mul(v, w):
+    _check_num_vectors(v, w, "vector-mul")
+    x, y = _numpy_view(v, 'd'), _numpy_view(w, 'd')
+    if x is not None and y is not None:
+        with numpy.errstate(all="ignore"):
+            return _vector_of_array(array('d', (x * y).tobytes()))
+    return Vector(map(operator.mul, v.items, w.items))
+
+@primitive("vector-sum")
+def scheme_vector_sum(v):
+    _check_num_vector(v, 0, "vector-sum")
+    x = _numpy_view(v, 'd')
+    if x is not None:
+        with numpy.errstate(all="ignore"):
+            return _scheme_number(x.sum())
+    return _scheme_number(sum(v.items))
+
+@primitive("vector-dot")
+def scheme_vector_dot(v, w):
+    _check_num_vectors(v, w, "vector-dot")
+    x, y = _numpy_view(v, 'd'), _numpy_view(w, 'd')
+    if x is not None and y is not None:
+        with numpy.errstate(all="ignore"):
+            return _scheme_number(x.dot(y))
+    return _scheme_number(sum(map(operator.mul, v.items, w.items)))
+
+def _vector_extreme(v, name, numpy_fn, fn):
+    """The least or greatest element of V, found with NUMPY_FN when V can be
+    viewed as a NumPy array and with FN otherwise."""
+    _check_num_vector(v, 0, name)
+    if not v.items:
+        raise SchemeError("{0}: empty vector".format(name))
+    x = _numpy_view(v, 'q', 'd')
+    if x is not None:
+        return _scheme_number(numpy_fn(x))
+    return _scheme_number(fn(v.items))
+
+@primitive("vector-min")
+def scheme_vector_min(v):
+    return _vector_extreme(v, "vector-min", numpy and numpy.min, min)
+
+@primitive("vector-max")
+def scheme_vector_max(v):
+    return _vector_extreme(v, "vector-max", numpy and numpy.max, max)
+
+@primitive("vector-sort")
+def scheme_vector_sort(v):
+    """A new vector of the numbers in V in increasing order."""
+    _check_num_vector(v, 0, "vector-sort")
+    items = v.items
+    x = _numpy_view(v, 'q', 'd')
+    if x is not None:
+        return _vector_of_array(array(items.typecode, numpy.sort(x).tobytes()))
+    if type(items) is list:
+        return Vector(sorted(items))
+    return _vector_of_array(array(items.typecode, sorted(items)))
+
+@primitive("vector-map", use_env=True)
+def scheme_vector_map(proc, *args):
+    """A new vector of the values of PROC on the elements of the vectors in
+    ARGS at each index, followed by the calling environment.  When PROC is
+    a primitive in _NUMPY_UFUNCS and there are several vectors, all stored
+    in float arrays, the values are computed by NumPy instead."""
+    vectors, env = args[:-1], args[-1]
+    if not vectors:
+        raise SchemeError("vector-map: no vectors")
+    for k, v in enumerate(vectors, 1):
+        check_type(v, scheme_vectorp, k, "vector-map")
+        if len(v.items) != len(vectors[0].items):
+            raise SchemeError("vector-map: vectors differ in length")
+    if isinstance(proc, PrimitiveProcedure) and len(vectors) > 1:
+        ufunc = _NUMPY_UFUNCS.get(proc.fn) if numpy is not None else None
+        views = [_numpy_view(v, 'd') for v in vectors]
+        if ufunc is not None and all(x is not None for x in views):
+            result = views[0]
+            with numpy.errstate(all="ignore"):
+                for x in views[1:]:
+                    result = ufunc(result, x)
+            return Vector(map(_scheme_number, result.tolist()))
+    apply = env.global_frame().applier
+    return Vector(apply(proc, scheme_list(*items), env)
+                  for items in zip(*(v.items for v in vectors)))
+
+##
+## Hash tables (non-standard)
+##
+
+_NO_DEFAULT = object()
+
+@primitive("hash-table?")
+def scheme_hash_tablep(x):
+    return isinstance(x, HashTable)
+
+@primitive("make-hash-table")
+def scheme_make_hash_table():
+    return HashTable()
+
+@primitive("hash-table-ref")
+def scheme_hash_table_ref(table, key, default=_NO_DEFAULT):
+    """The value of KEY in TABLE, or DEFAULT if given and KEY is absent."""
+    check_type(table, scheme_hash_tablep, 0, "hash-table-ref")
+    try:
+        return table[key]
+    except KeyError:
+        if default is _NO_DEFAULT:
+            raise SchemeError("key not found: {0}".format(str(key)))
+        return default
+
+@primitive("hash-table-set!")
+def scheme_hash_table_set(table, key, value):
+    check_type(table, scheme_hash_tablep, 0, "hash-table-set!")
+    table[key] = value
+
+@primitive("hash-table-delete!")
+def scheme_hash_table_delete(table, key):
+    check_type(table, scheme_hash_tablep, 0, "hash-table-delete!")
+    del table[key]
+
+@primitive("hash-table-count")
+def scheme_hash_table_count(table):
+    check_type(table, scheme_hash_tablep, 0, "hash-table-count")
+    return len(table)
+
+@primitive("hash-table-keys")
+def scheme_hash_table_keys(table):
+    check_type(table, scheme_hash_tablep, 0, "hash-table-keys")
+    return scheme_list(*(key for key, _ in table.items()))
+
+@primitive("hash-table-walk", use_env=True)
+def scheme_hash_table_walk(table, proc, env):
+    """Call PROC on each key and value in TABLE.  PROC may change TABLE; it is
+    called on the entries present when the walk began."""
+    check_type(table, scheme_hash_tablep, 0, "hash-table-walk")
+    apply = env.global_frame().applier
+    for key, value in table.items():
+        apply(proc, scheme_list(key, value), env)
+
+##
+## Memoization (non-standard)
+##
+
+MEMOIZE_SIZE = 1024
+
+@primitive("memoize")
+def scheme_memoize(proc, size=MEMOIZE_SIZE):
+    """A procedure that returns the values of PROC, caching up to SIZE of
+    them.  Redefining the name of a recursive procedure as its memoized
+    version also caches its recursive calls."""
+    check_type(size, lambda k: isinstance(k, int) and k > 0, 1, "memoize")
+    return MemoizedProcedure(proc, size)
+
+@primitive("memoize-stats")
+def scheme_memoize_stats(proc):
+    """A list of the hits, misses, evictions and cached values of PROC."""
+    check_type(proc, lambda p: isinstance(p, MemoizedProcedure), 0,
+               "memoize-stats")
+    return scheme_list(proc.hits, proc.misses, proc.evictions,
+                       len(proc.cache))
+
+@primitive("memoize-clear!")
+def scheme_memoize_clear(proc):
+    check_type(proc, lambda p: isinstance(p, MemoizedProcedure), 0,
+               "memoize-clear!")
+    proc.cache.clear()
+
 @primitive("symbol?")
 def scheme_symbolp(x):
     return isinstance(x, str)
@@ -258,7 +1041,18 @@ def _check_nums(*vals):
 
 def _arith(fn, init, vals):
     """Perform the fn fneration on the number values of VALS, with INIT as
-    the value when VALS is empty. Returns the result as a Scheme value."""
+    the value when VALS is empty. Returns the result as a Scheme value.
+    Operations on ints alone that give an int skip the checks and rounding
+    applied to other operands."""
+    if type(init) is int:
+        s = init
+        for val in vals:
+            if type(val) is not int:
+                break
+            s = fn(s, val)
+        else:
+            if type(s) is int:
+                return s
     _check_nums(*vals)
     s = init
     for val in vals:
@@ -267,20 +1061,41 @@ def _arith(fn, init, vals):
         s = round(s)
     return s
 
+# Each arithmetic primitive handles the common case of two int operands
+# directly, and otherwise defers to _arith.
+
 @primitive("+")
 def scheme_add(*vals):
+    if len(vals) == 2:
+        x, y = vals
+        if type(x) is int and type(y) is int:
+            return x + y
     return _arith(operator.add, 0, vals)
 
 @primitive("-")
 def scheme_sub(val0, *vals):
     if len(vals) == 0:
         return -val0
+    if len(vals) == 1 and type(val0) is int and type(vals[0]) is int:
+        return val0 - vals[0]
     return _arith(operator.sub, val0, vals)
 
 @primitive("*")
 def scheme_mul(*vals):
+    if len(vals) == 2:
+        x, y = vals
+        if type(x) is int and type(y) is int:
+            return x * y
     return _arith(operator.mul, 1, vals)
 
+# The NumPy functions that give the same values as arithmetic primitives on
+# two or more floats, once whole floats are converted to ints.  Used by
+# vector-map.
+_NUMPY_UFUNCS = {}
+if numpy is not None:
+    _NUMPY_UFUNCS = {scheme_add: numpy.add, scheme_sub: numpy.subtract,
+                     scheme_mul: numpy.multiply}
+
 @primitive("/")
 def scheme_div(val0, val1):
     return _arith(operator.truediv, val0, [val1])
@@ -303,36 +1118,221 @@ def scheme_ceil(val):
     _check_nums(val)
     return math.ceil(val)
 
+_NUMBER_TYPES = (int, float)
+
 def _numcomp(op, x, y):
-    _check_nums(x, y)
+    if type(x) not in _NUMBER_TYPES or type(y) not in _NUMBER_TYPES:
+        _check_nums(x, y)
     return op(x, y)
 
 @primitive("=")
 def scheme_eq(x, y):
+    if type(x) is int and type(y) is int:
+        return x == y
     return _numcomp(operator.eq, x, y)
 
 @primitive("<")
 def scheme_lt(x, y):
+    if type(x) is int and type(y) is int:
+        return x < y
     return _numcomp(operator.lt, x, y)
 
 @primitive(">")
 def scheme_gt(x, y):
+    if type(x) is int and type(y) is int:
+        return x > y
     return _numcomp(operator.gt, x, y)
 
 @primitive("<=")
 def scheme_le(x, y):
+    if type(x) is int and type(y) is int:
+        return x <= y
     return _numcomp(operator.le, x, y)
 
 @primitive(">=")
 def scheme_ge(x, y):
+    if type(x) is int and type(y) is int:
+        return x >= y
     return _numcomp(operator.ge, x, y)
 
+##
+## Promises and streams
+##
+
+# A stream is either nil or a pair of its first element and a Promise of the
+# rest of the stream, as made by the cons-stream special form.  Streams are
+# traversed by loops, and the promises made by stream operations refer to the
+# promise of the rest of their input rather than to the pair holding it.
+
+@primitive("promise?")
+def scheme_promisep(x):
+    return type(x) is Promise
+
+@primitive("force")
+def scheme_force(x):
+    """The value of the promise X, or X itself if it is not a promise."""
+    return x.force() if type(x) is Promise else x
+
+@primitive("stream-pair?")
+def scheme_stream_pairp(x):
+    return isinstance(x, Pair) and type(x.second) is Promise
+
+@primitive("stream-null?")
+def scheme_stream_nullp(x):
+    return x is NULL
+
+def _check_stream(stream, k, name):
+    """Check that STREAM, argument K of NAME, is a stream, returning it."""
+    if stream is not NULL:
+        check_type(stream, scheme_stream_pairp, k, name)
+    return stream
+
+@primitive("stream-car")
+def scheme_stream_car(stream):
+    return check_type(stream, scheme_stream_pairp, 0, "stream-car").first
+
+@primitive("stream-cdr")
+def scheme_stream_cdr(stream):
+    check_type(stream, scheme_stream_pairp, 0, "stream-cdr")
+    return stream.second.force()
+
+@primitive("stream-map", use_env=True)
+def scheme_stream_map(proc, stream, env):
+    """The stream of the values of PROC on the elements of STREAM, each
+    computed when the stream is traversed to it."""
+    if _check_stream(stream, 1, "stream-map") is NULL:
+        return NULL
+    apply, rest = env.global_frame().applier, stream.second
+    return Pair(apply(proc, Pair(stream.first, NULL), env),
+                Promise(lambda: scheme_stream_map(proc, rest.force(), env)))
+
+@primitive("stream-filter", use_env=True)
+def scheme_stream_filter(pred, stream, env):
+    """The stream of the elements of STREAM for which PRED is true."""
+    apply = env.global_frame().applier
+    while _check_stream(stream, 1, "stream-filter") is not NULL:
+        rest = stream.second
+        if scheme_true(apply(pred, Pair(stream.first, NULL), env)):
+            return Pair(stream.first, Promise(
+                lambda: scheme_stream_filter(pred, rest.force(), env)))
+        stream = rest.force()
+    return NULL
+
+@primitive("stream-take")
+def scheme_stream_take(stream, k):
+    """The stream of the first K elements of STREAM, or of all of them if it
+    has fewer."""
+    check_type(k, lambda k: isinstance(k, int), 1, "stream-take")
+    if k <= 0 or _check_stream(stream, 0, "stream-take") is NULL:
+        return NULL
+    if k == 1:
+        return Pair(stream.first, Promise(lambda: NULL))
+    rest = stream.second
+    return Pair(stream.first,
+                Promise(lambda: scheme_stream_take(rest.force(), k - 1)))
+
+@primitive("stream->list")
+def scheme_stream_to_list(stream, k=None):
+    """A list of the elements of STREAM, or of its first K elements."""
+    values = []
+    while k is None or len(values) < k:
+        if _check_stream(stream, 0, "stream->list") is NULL:
+            break
+        values.append(stream.first)
+        if len(values) != k:
+            stream = stream.second.force()
+    return scheme_list(*values)
+
+##
+## Strings
+##
+
+@primitive("string?")
+def scheme_stringp(x):
+    return type(x) is String
+
+def _check_strings(name, *vals):
+    """Check that all arguments VALS of NAME are strings, returning their
+    text."""
+    for k, val in enumerate(vals):
+        check_type(val, scheme_stringp, k, name)
+    return [val.text for val in vals]
+
+@primitive("string-length")
+def scheme_string_length(s):
+    return len(_check_strings("string-length", s)[0])
+
+@primitive("string-append")
+def scheme_string_append(*vals):
+    """The concatenation of the strings VALS, joined in one step."""
+    return String("".join(_check_strings("string-append", *vals)))
+
+@primitive("substring")
+def scheme_substring(s, start, end=None):
+    text = _check_strings("substring", s)[0]
+    end = len(text) if end is None else end
+    for k, index in ((1, start), (2, end)):
+        if not isinstance(index, int) or not 0 <= index <= len(text):
+            raise SchemeError("argument {0} of substring is out of range"
+                              .format(k))
+    if start > end:
+        raise SchemeError("substring start {0} is after its end {1}"
+                          .format(start, end))
+    return String(text[start:end])
+
+@primitive("string=?")
+def scheme_string_eq(x, y):
+    x, y = _check_strings("string=?", x, y)
+    return x == y
+
+@primitive("string<?")
+def scheme_string_lt(x, y):
+    x, y = _check_strings("string<?", x, y)
+    return x < y
+
+@primitive("string->symbol")
+def scheme_string_to_symbol(s):
+    return Symbol(_check_strings("string->symbol", s)[0])
+
+@primitive("symbol->string")
+def scheme_symbol_to_string(sym):
+    return String(check_type(sym, scheme_symbolp, 0, "symbol->string"))
+
+@primitive("number->string")
+def scheme_number_to_string(x):
+    return String(str(check_type(x, scheme_numberp, 0, "number->string")))
+
+_NUMERAL = re.compile(r"[+-]?([0-9]+)?(\.[0-9]*)?([eE][+-]?[0-9]+)?")
+
+@primitive("string->number")
+def scheme_string_to_number(s):
+    """The number written as the string S, or False if S is not a numeral."""
+    text = _check_strings("string->number", s)[0]
+    numeral = _NUMERAL.fullmatch(text)
+    if numeral is None or not (numeral.group(1) or (numeral.group(2) or "")[1:]):
+        return False
+    return float(text) if numeral.group(2) or numeral.group(3) else int(text)
+
+@primitive("open-output-string")
+def scheme_open_output_string():
+    return StringOutputPort()
+
+def _string_output_portp(x):
+    return isinstance(x, StringOutputPort)
+
+@primitive("get-output-string")
+def scheme_get_output_string(port):
+    check_type(port, _string_output_portp, 0, "get-output-string")
+    return String(port.getvalue())
+
 ##
 ## Other operations
 ##
 
 @primitive("atom?")
 def scheme_atomp(x):
+    if scheme_stringp(x):
+        return True
     if scheme_booleanp(x):
         return True
     if scheme_numberp(x):
@@ -348,13 +1348,36 @@ def scheme_eof_objectp(x):
     return x is EOF
 
 @primitive("display")
-def scheme_display(val):
-    print(str(val), end="")
+def scheme_display(val, port=None):
+    text = val.text if type(val) is String else str(val)
+    _output_port(port, 1, "display").write(text)
+
+@primitive("write")
+def scheme_write(val, port=None):
+    _output_port(port, 1, "write").write(str(val))
 
 @primitive("newline")
-def scheme_newline():
-    print()
-    sys.stdout.flush()
+def scheme_newline(port=None):
+    _output_port(port, 0, "newline").newline()
+
+@primitive("flush-output")
+def scheme_flush_output(port=None):
+    _output_port(port, 0, "flush-output").flush()
+
+@primitive("output-port?")
+def scheme_output_portp(x):
+    return isinstance(x, OutputPort)
+
+@primitive("current-output-port")
+def scheme_current_output_port():
+    return OUTPUT_PORT
+
+def _output_port(port, k, name):
+    """The output port PORT, argument K of NAME, or OUTPUT_PORT if PORT is
+    None."""
+    if port is None:
+        return OUTPUT_PORT
+    return check_type(port, scheme_output_portp, k, name)
 
 @primitive("error")
 def scheme_error(msg = None):
@@ -0,0 +1,81 @@
+"""Tests of the --stream and --stream=mmap options of the Scheme interpreter.
+
+Usage: python3 scheme_stream_test.py [--evaluator=NAME]
+
+Runs scheme.py with each option on a generated source file in which a form, a
+numeral, a string, a comment, and a boolean each span the boundary between two
+chunks of STREAM_CHUNK_SIZE characters, and in which an error is reported
+between other forms.  Only the comment is followed by a line break, so the
+chunks cannot be split into lines.  The output printed to stdout and to
+stderr is compared to the output expected.  The --evaluator option selects
+the evaluator that runs the source (see scheme.EVALUATORS).
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+from ucb import main
+from scheme import STREAM_CHUNK_SIZE, parse_evaluator
+
+SCHEME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scheme.py")
+
+def straddle(source, text, split):
+    """Append TEXT to the list of strings SOURCE after enough spaces that a
+    chunk begins with the character of TEXT at index SPLIT."""
+    length = sum(map(len, source))
+    padding = (STREAM_CHUNK_SIZE - split - length) % STREAM_CHUNK_SIZE
+    source.append(" " * padding + text)
+
+def stream_source(count=20000):
+    """The text of the test source and the output expected on stdout, for a
+    list of COUNT numbers quoted in one form."""
+    source = ["(define nums '(",
+              " ".join(map(str, range(count))),
+              "))(display (length nums))(newline)"]
+    straddle(source, "(display 12345)(newline)", len("(display 123"))
+    straddle(source, '(display "spans chunks")(newline)(car nil)',
+             len('(display "spans'))
+    straddle(source, "; a comment spanning chunks (car nil)\n",
+             len("; a comment"))
+    straddle(source, "(display #t)(newline)", len("(display #"))
+    source.append("(display (apply + nums))")
+    expected = [str(count), "12345", "spans chunks", "True",
+                str(count * (count - 1) // 2)]
+    return "".join(source), "\n".join(expected)
+
+def run_stream(option, path, evaluator):
+    """Run scheme.py with OPTION on the source at PATH, returning what it
+    prints to stdout and to stderr."""
+    args = [sys.executable, SCHEME, "--evaluator=" + evaluator, option]
+    with open(path) as source:
+        if option == "--stream=mmap":
+            args.append(path)
+        result = subprocess.run(args, stdin=source, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True, timeout=120)
+    return result.stdout, result.stderr
+
+@main
+def run_tests(*argv):
+    """Run each streaming option of scheme.py on the test source and report
+    the differences from the expected output."""
+    evaluator, argv = parse_evaluator(argv)
+    source, expected = stream_source()
+    num_tested = num_failed = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "stream.scm")
+        with open(path, "w") as f:
+            f.write(source)
+        for option in ("--stream", "--stream=mmap"):
+            output, errors = run_stream(option, path, evaluator)
+            num_tested += 1
+            errors = errors.splitlines()
+            if (output != expected or len(errors) != 1
+                    or not errors[0].startswith("Error")):
+                num_failed += 1
+                print("test failed for {0}".format(option))
+                print("  expected: {0!r} and one error".format(expected))
+                print("   printed: {0!r}".format(output))
+                print("    errors: {0!r}".format(errors))
+    print('{0} tested; {1} failed.'.format(num_tested, num_failed))
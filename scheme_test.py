@@ -1,6 +1,7 @@
 """Unit testing framework for the Logo interpreter.
 
-Usage: python3 scheme_test.py FILE
+Usage: python3 scheme_test.py [--evaluator=NAME] [--jobs=N] [--slowest=K]
+                              [FILE ...]
 
 Interprets FILE as interactive Scheme source code, and compares each line
 of printed output from the read-eval-print loop and from any output functions
@@ -10,66 +11,137 @@ to an expected output described in a comment.  For example,
 ; expect 5
 
 Differences between printed and expected outputs are printed with line numbers.
+The --evaluator option selects the evaluator that runs FILE (see
+scheme.EVALUATORS).
+
+Each FILE (default tests.scm) is run in a new global frame.  The --jobs option
+runs the files in N worker processes at once.  The --slowest option prints the
+K tests that took longest; each test is timed from the end of the one before.
 """
 
 import io
 import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout, redirect_stderr
 from buffer import Buffer
 from ucb import main
-from scheme import scheme_repl, create_global_frame
+from scheme import (scheme_repl, create_global_frame, parse_evaluator,
+                    parse_options)
 
-def summarize(output, expected_output):
-    """Summarize results of running tests."""
+def summarize(output, expected_output, src_file=None):
+    """Summarize results of running tests, naming SRC_FILE in failures if it
+    is given.  Returns the number of tests failed."""
+    where = 'line {0}' if src_file is None else 'line {0} of ' + src_file
     num_failed, num_expected = 0, len(expected_output)
-    for (actual, (expected, line_number)) in zip(output, expected_output):
+    for (actual, (expected, line_number, _)) in zip(output, expected_output):
         if expected.startswith("Error"):
             if not actual.startswith("Error"):
                 num_failed += 1
-                print('test failed at line {0}'.format(line_number))
+                print('test failed at ' + where.format(line_number))
                 print('  expected an error indication')
                 print('   printed: {0}'.format(actual))
         elif actual != expected:
             num_failed += 1
-            print('test failed at line {0}'.format(line_number))
+            print('test failed at ' + where.format(line_number))
             print('  expected: {0}'.format(expected))
             print('   printed: {0}'.format(actual))
-    print('{0} tested; {1} failed.'.format(num_expected, num_failed))
+    if src_file is None:
+        print('{0} tested; {1} failed.'.format(num_expected, num_failed))
+    return num_failed
 
 EXPECT_STRING = '; expect'
 
-@main
-def run_tests(src_file = 'tests.scm'):
-    """Run a read-eval loop that reads from src_file and collects outputs."""
+def run_file(src_file, evaluator):
+    """Run the tests in SRC_FILE in a new global frame of EVALUATOR, capturing
+    their output.  Returns the lines printed, the expected outputs as tuples
+    (expected, line number, seconds taken), the seconds taken in all, and a
+    description of the unhandled exception that ended the tests, if any.  A
+    call to exit also ends the tests of SRC_FILE, without ending the run."""
     expected_output = []
     line_number = 0
+    last = start = time.perf_counter()
 
     def read_lines(src):
         """Creates a generator that returns the lines of src, filtering out
         '; expect' strings and collecting them into expected_output with their
-        line numbers.  The variable line_number gives the number of the last
-        line returned for diagnostic purposes."""
-        nonlocal line_number
+        line numbers and the time since the last was read.  The variable
+        line_number gives the number of the last line returned for diagnostic
+        purposes."""
+        nonlocal line_number, last
         while True:
             line_number += 1
             line = src.readline()
             if line.lstrip().startswith(EXPECT_STRING):
                 expected = line.split(EXPECT_STRING, 1)[1][1:-1]
-                expected_output.append((expected, line_number))
+                now = time.perf_counter()
+                expected_output.append((expected, line_number, now - last))
+                last = now
                 continue
             if not line:
                 return
             yield line
 
-    sys.stderr = sys.stdout = io.StringIO() # Collect output to stdout and stderr
-    try:
-        source = read_lines(open(src_file))
-        scheme_repl(source, "", create_global_frame(), False)
-    except BaseException as exc:
-        sys.stderr = sys.__stderr__
-        print("Tests terminated due to unhandled exception "
-              "after line {0}:\n>>>".format(line_number),
-              file=sys.stderr)
-        raise
-    output = sys.stdout.getvalue().split('\n')
-    sys.stdout = sys.__stdout__  # Revert stdout
-    summarize(output, expected_output)
+    output = io.StringIO() # Collect output to stdout and stderr
+    error = None
+    with redirect_stdout(output), redirect_stderr(output):
+        try:
+            with open(src_file) as src:
+                scheme_repl(read_lines(src), "", create_global_frame(evaluator),
+                            False)
+        except BaseException as exc:
+            error = ("Tests terminated due to unhandled exception "
+                     "after line {0} of {1}:\n>>>\n{2}".format(
+                         line_number, src_file, traceback.format_exc()))
+            if not isinstance(exc, (Exception, SystemExit)):
+                raise
+    elapsed = time.perf_counter() - start
+    return output.getvalue().split('\n'), expected_output, elapsed, error
+
+@main
+def run_tests(*argv):
+    """Run a read-eval loop that reads from each source file and collects
+    outputs."""
+    evaluator, argv = parse_evaluator(argv)
+    options = {"jobs": "1", "slowest": "0"}
+    src_files = parse_options(argv, options) or ['tests.scm']
+    jobs = int(options["jobs"])
+    if jobs > 1 and len(src_files) > 1:
+        with ProcessPoolExecutor(jobs) as pool:
+            results = list(pool.map(run_file, src_files,
+                                    [evaluator] * len(src_files)))
+    else:
+        results = [run_file(src_file, evaluator) for src_file in src_files]
+
+    if len(src_files) == 1:
+        output, expected_output, _, error = results[0]
+        if error is not None:
+            print(error, file=sys.stderr)
+            sys.exit(1)
+        summarize(output, expected_output)
+    else:
+        num_expected = num_failed = 0
+        for src_file, (output, expected_output, elapsed, error) in zip(
+                src_files, results):
+            if error is not None:
+                print(error, file=sys.stderr)
+                failed = 1
+            else:
+                failed = summarize(output, expected_output, src_file)
+            print('{0}: {1} tested; {2} failed in {3:.2f}s.'.format(
+                src_file, len(expected_output), failed, elapsed))
+            num_expected += len(expected_output)
+            num_failed += failed
+        print('{0} tested; {1} failed.'.format(num_expected, num_failed))
+
+    slowest = int(options["slowest"])
+    if slowest:
+        tests = [(seconds, line_number, src_file)
+                 for src_file, result in zip(src_files, results)
+                 for _, line_number, seconds in result[1]]
+        tests.sort(reverse=True)
+        print('slowest tests:')
+        for seconds, line_number, src_file in tests[:slowest]:
+            print('  {0:.4f}s  line {1} of {2}'.format(seconds, line_number,
+                                                      src_file))
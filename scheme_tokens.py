@@ -1,17 +1,21 @@
-"""The scheme_tokens module provides functions tokenize_line and tokenize_lines
-for converting (iterators producing) strings into (iterators producing) lists
-of tokens.  A token may be:
+"""The scheme_tokens module provides functions tokenize_line, tokenize_lines,
+and tokenize_chunks for converting (iterators producing) strings into
+(iterators producing) lists of tokens.  A token may be:
 
   * A number (represented as an int or float)
   * A boolean (represented as a bool)
-  * A symbol (represented as a string)
+  * A symbol (represented as a Symbol)
+  * A string (represented as a String)
   * The empty list (represented as NULL)
-  * A delimiter, including parentheses, dots, and single quotes
+  * A delimiter, including parentheses, dots, single quotes, and the #( that
+    opens a vector
 """
 
+import re
 import string
 import sys
-from scheme_primitives import NULL, SchemeError
+from buffer import LinePart
+from scheme_primitives import NULL, OUTPUT_PORT, SchemeError, String, Symbol
 
 _SYMBOL_STARTS = set('!$%&*/:<=>?@^_~') | set(string.ascii_lowercase)
 _SYMBOL_INNERS = _SYMBOL_STARTS | set(string.digits) | set('+-.')
@@ -19,72 +23,189 @@ _NUMERAL_STARTS = set(string.digits) | set('+-.')
 _WHITESPACE = set(' \t\n\r')
 _SINGLE_CHAR_TOKENS = set("()'")
 _TOKEN_END = _WHITESPACE | _SINGLE_CHAR_TOKENS
-DELIMITERS = _SINGLE_CHAR_TOKENS | {'.'}
+DELIMITERS = _SINGLE_CHAR_TOKENS | {'.', '#('}
+
+# The next candidate token of a line, after any whitespace: a comment, a
+# delimiter that is always a token by itself (a single-character token or #(),
+# a string literal (up to its closing quote, if any, or a final backslash that
+# escapes the next character), # and the character that
+# follows it (as in #t and #f), or a run of characters up to whitespace, a
+# single-character token or a string.
+_CANDIDATE = re.compile(r"""[ \t\n\r]*(?:
+    (;[\s\S]*)
+  | (\#\(|[()'])
+  | ("(?:[^"\\]|\\[\s\S])*["\\]?|\#[\s\S]?|[^ \t\n\r()'"]+))""", re.VERBOSE)
+
+_SYMBOL = re.compile("[{0}][{1}]*".format(
+    re.escape(''.join(sorted(_SYMBOL_STARTS))),
+    re.escape(''.join(sorted(_SYMBOL_INNERS)))))
+_STRING = re.compile(r'"((?:[^"\\]|\\[\s\S])*)"')
+_ESCAPE = re.compile(r"\\([\s\S])")
+_ESCAPED_CHARS = {'n': '\n', 't': '\t'}
+_BOOLEAN_WORDS = {'true': True, 'false': False}
+
+# Tokens already classified, by their text.  Only valid tokens are cached, and
+# the cache is emptied when it reaches _CACHE_LIMIT entries.
+_CACHE_LIMIT = 1 << 16
+_FIXED_TOKENS = {'.': '.', '+': Symbol('+'), '-': Symbol('-'), 'nil': NULL,
+                 '#t': True, '#f': False}
+_token_cache = dict(_FIXED_TOKENS)
+
+# The number of invalid-token warnings printed
+_warnings = 0
 
 def valid_symbol(s):
     """Returns whether s is not a well-formed value."""
-    if len(s) == 0 or s[0] not in _SYMBOL_STARTS:
-        return False
-    for c in s[1:]:
-        if c not in _SYMBOL_INNERS:
-            return False
-    return True
-
-def _next_candidate_token(line, k):
-    """A tuple (tok, k'), where tok is the next substring of LINE at or
-    after position K that could be a token (assuming it passes a validity
-    check), and k' is the position in LINE following that token.  Returns
-    (None, len(line)) when there are no more tokens."""
-    while k < len(line):
-        c = line[k]
-        if c == ';':
-            return None, len(line)
-        elif c in _WHITESPACE:
-            k += 1
-        elif c in _SINGLE_CHAR_TOKENS:
-            return c, k+1
-        elif c == '#':  # Boolean values #t and #f
-            return line[k:k+2], min(k+2, len(line))
-        else:
-            j = k
-            while j < len(line) and line[j] not in _TOKEN_END:
-                j += 1
-            return line[k:j], min(j, len(line))
-    return None, len(line)
+    return _SYMBOL.fullmatch(s) is not None
 
-def tokenize_line(line):
-    """The list of Scheme tokens on LINE.  Excludes comments and whitespace."""
-    result = []
-    text, i = _next_candidate_token(line, 0)
-    while text is not None:
-        if text in DELIMITERS:
-            result.append(text)
-        elif text == '+' or text == '-':
-            result.append(text)
-        elif text == '#t' or text.lower() == 'true':
-            result.append(True)
-        elif text == '#f' or text.lower() == 'false':
-            result.append(False)
-        elif text == 'nil':
-            result.append(NULL)
-        elif text[0] in _NUMERAL_STARTS:
+def _classify(text):
+    """The token for the candidate TEXT, or None if it is not valid."""
+    if text[0] == '"':
+        string = _STRING.fullmatch(text)
+        if string is None:
+            raise SchemeError("unterminated string: {0}".format(text))
+        return String(_ESCAPE.sub(_unescape, string.group(1)))
+    elif 3 < len(text) < 6 and text.lower() in _BOOLEAN_WORDS:
+        return _BOOLEAN_WORDS[text.lower()]
+    elif text[0] in _NUMERAL_STARTS:
+        try:
+            return int(text)
+        except ValueError:
             try:
-                result.append(int(text))
+                return float(text)
             except ValueError:
-                try:
-                    result.append(float(text))
-                except ValueError:
-                    raise SchemeError("invalid numeral: {0}".format(text))
-        elif text[0] in _SYMBOL_STARTS and valid_symbol(text):
-            result.append(text)
-        else:
-            print("warning: invalid token: {0}".format(text), file=sys.stderr)
-            print("    ", line, file=sys.stderr)
-            print(" " * (i+3), "^", file=sys.stderr)
-        text, i = _next_candidate_token(line, i)
+                raise SchemeError("invalid numeral: {0}".format(text))
+    elif _SYMBOL.fullmatch(text):
+        return Symbol(text)
+    return None
+
+def _unescape(match):
+    """The character denoted by the escape sequence MATCH in a string."""
+    char = match.group(1)
+    return _ESCAPED_CHARS.get(char, char)
+
+def tokenize_line(line):
+    """The list of Scheme tokens on LINE.  Excludes comments and whitespace.
+
+    >>> tokenize_line("(define (f x) (+ x 1.5)) ; comment")
+    ['(', 'define', '(', 'f', 'x', ')', '(', '+', 'x', 1.5, ')', ')']
+    >>> tokenize_line("'(#t False nil . -2)")
+    ["'", '(', True, False, NULL, '.', -2, ')']
+    >>> tokenize_line("1_000 +1_0 1\u0663 -4. 5e-1")
+    [1000, 10, 13, -4.0, 0.5]
+    >>> tokenize_line("#(1 #(a))")
+    ['#(', 1, '#(', 'a', ')', ')']
+    >>> tokenize_line(r'(display "say \\"hi\\"\\n")')
+    ['(', 'display', String('say "hi"\\n'), ')']
+    """
+    global _token_cache
+    result = []
+    append, cache = result.append, _token_cache
+    # Trailing whitespace is removed first; otherwise a search for a candidate
+    # would start at each of its characters and scan the rest of it.
+    candidates = _CANDIDATE.findall(line.rstrip(" \t\n\r"))
+    for k, (comment, single, text) in enumerate(candidates):
+        if single:
+            append(single)
+            continue
+        elif comment:
+            break
+        token = cache.get(text)
+        if token is None:
+            token = _classify(text)
+            if token is None:
+                _warn_invalid(line, k, text)
+                continue
+            if len(cache) >= _CACHE_LIMIT:
+                cache = _token_cache = dict(_FIXED_TOKENS)
+            cache[text] = token
+        append(token)
     return result
 
+def _warn_invalid(line, k, text):
+    """Print a warning that TEXT, the Kth candidate token on LINE, is not a
+    valid token, marking the position following it.  Output is flushed first,
+    so that the warning follows what was displayed before it."""
+    global _warnings
+    _warnings += 1
+    for i, m in enumerate(_CANDIDATE.finditer(line)):
+        if i == k:
+            break
+    i = m.end()
+    OUTPUT_PORT.flush()
+    print("warning: invalid token: {0}".format(text), file=sys.stderr)
+    print("    ", line, file=sys.stderr)
+    print(" " * (i+3), "^", file=sys.stderr)
+
+def warning_count():
+    """The number of warnings printed so far for invalid tokens."""
+    return _warnings
+
 def tokenize_lines(input):
     """An iterator that returns lists of tokens, one for each line read from
     the file INPUT."""
     return map(tokenize_line, input)
+
+def tokenize_chunks(chunks):
+    """An iterator that returns lists of tokens read from CHUNKS, an iterable
+    of strings of source text that may break anywhere, including within a
+    line or a token.  A list is returned for each line and for the part of a
+    line that ends a chunk, so a line that spans chunks is never held in
+    memory as a whole.  The lists for the parts of a line but its last are
+    each a LinePart.
+
+    >>> for tokens in tokenize_chunks(["(define x", " 1)\\n(+ x", "", ' "a b',
+    ...                                 '" 2.', '5) ; no', 'te\\n#', 't']):
+    ...     print(type(tokens).__name__, tokens)
+    LinePart ['(', 'define']
+    list ['x', 1, ')']
+    LinePart ['(', '+']
+    LinePart ['x']
+    LinePart [String('a b')]
+    LinePart [2.5, ')']
+    list []
+    list [True]
+    """
+    return map(_tokenize_piece, _chunk_pieces(chunks))
+
+def _tokenize_piece(piece):
+    """The tokens of PIECE, a pair of text and whether it ends a line."""
+    text, line_end = piece
+    tokens = tokenize_line(text)
+    return tokens if line_end else LinePart(tokens)
+
+def _chunk_pieces(chunks):
+    """An iterator over the pieces of text in CHUNKS that end a line or end
+    just before the last candidate token of a chunk, each paired with whether
+    it ends a line.  Only the text of that token, which may continue in the
+    next chunk, is kept between chunks; a comment is skipped up to the end of
+    its line instead."""
+    pending, comment = "", False
+    for chunk in chunks:
+        start = 0
+        if comment:
+            start = chunk.find("\n") + 1
+            if not start:
+                continue
+            yield "", True
+            comment = False
+        end = chunk.find("\n", start) + 1
+        while end:
+            yield pending + chunk[start:end], True
+            pending, start = "", end
+            end = chunk.find("\n", start) + 1
+        tail, last = pending + chunk[start:], None
+        for last in _CANDIDATE.finditer(tail):
+            pass
+        if last is None: # Only whitespace
+            pending = ""
+        elif last.group(1): # A comment, which ends with its line
+            if last.start(1):
+                yield tail[:last.start(1)], False
+            pending, comment = "", True
+        else:
+            if last.start():
+                yield tail[:last.start()], False
+            pending = tail[last.start():]
+    if pending:
+        yield pending, True
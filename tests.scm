@@ -524,6 +524,241 @@ one-through-four
 (f 1 2 3 4 5)
 ; expect (3 4 5)
 
+;;; Numerals
+
+(list 1_000 +1_0 -4. 5e-1)
+; expect (1000 10 -4.0 0.5)
+
+(integer? 1_000)
+; expect True
+
+;;; Tail calls run in constant stack depth
+
+(define (count n) (if (= n 0) 0 (count (- n 1))))
+(count 5000)
+; expect 0
+
+(define (count-cond n)
+  (cond ((= n 0) 'done)
+        (else (let ((m (- n 1))) (count-cond m)))))
+(count-cond 5000)
+; expect done
+
+(define (count-begin n)
+  (begin (if (= n 0) n (count-begin (- n 1)))))
+(count-begin 5000)
+; expect 0
+
+;;; Local names shadow enclosing ones
+
+(define x 10)
+(let* ((y x) (x 2)) (list x y))
+; expect (2 10)
+
+(define (scale a . rest)
+  (define factor (* a 2))
+  (cons factor rest))
+(scale 3 4 5)
+; expect (6 4 5)
+
+;;; Vectors
+
+(define v (make-vector 3 0))
+(vector-set! v 0 'a)
+v
+; expect #(a 0 0)
+
+#(1 (2 3) #(4))
+; expect #(1 (2 3) #(4))
+
+(vector-ref (vector 1 2.5 'c) 1)
+; expect 2.5
+
+(vector->list (list->vector '(1 2 3)))
+; expect (1 2 3)
+
+(define memo (make-vector 60 0))
+(define (fib n)
+  (cond ((< n 2) n)
+        ((> (vector-ref memo n) 0) (vector-ref memo n))
+        (else (vector-set! memo n (+ (fib (- n 1)) (fib (- n 2))))
+              (vector-ref memo n))))
+(fib 59)
+; expect 956722026041
+
+;;; Bulk numeric vector operations
+
+(vector-add #(1 2 3) #(4 5 6))
+; expect #(5 7 9)
+
+(vector-mul #(1.5 2.5) #(2.0 4.0))
+; expect #(3.0 10.0)
+
+(vector-sum #(1.5 1.5))
+; expect 3
+
+(vector-dot #(1 2 3) #(4 5 6))
+; expect 32
+
+(list (vector-min #(3 1 2)) (vector-max #(3 1.5)))
+; expect (1 3)
+
+(vector-sort #(3 1.5 2))
+; expect #(1.5 2 3)
+
+(vector-map + #(1.5 2.0) #(1.5 0.25))
+; expect #(3 2.25)
+
+(vector-map - #(1.5 2.0) #(0.5 0.25) #(1.0 1.0))
+; expect #(0 0.75)
+
+(vector-map (lambda (x) (* x x)) #(1 2 3))
+; expect #(1 4 9)
+
+(vector-map cons #(1 2) #(a b))
+; expect #((1 . a) (2 . b))
+
+(vector-map + #(1 2) #(1))
+; expect Error
+
+;;; Hash tables
+
+(define table (make-hash-table))
+(hash-table-set! table '(1 2) 'pair)
+(hash-table-set! table 'a 1)
+(hash-table-set! table #(1 (2)) 'vector)
+(list (hash-table-ref table (list 1 2))
+      (hash-table-ref table (vector 1 (list 2)))
+      (hash-table-ref table 'b 'missing))
+; expect (pair vector missing)
+
+(hash-table-delete! table 'a)
+(hash-table-keys table)
+; expect ((1 2) #(1 (2)))
+
+(hash-table-walk table (lambda (key value) (hash-table-set! table value key)))
+(hash-table-count table)
+; expect 4
+
+(define keys (make-hash-table))
+(hash-table-set! keys #t 'bool)
+(hash-table-set! keys 1 'one)
+(hash-table-set! keys 1.0 'one-point-zero)
+(hash-table-set! keys '(1 #t) 'list)
+(list (hash-table-ref keys #t) (hash-table-ref keys 1) (hash-table-ref keys 1.0)
+      (hash-table-ref keys '(#t 1) 'missing) (hash-table-ref keys '(1 #t)))
+; expect (bool one one-point-zero missing list)
+
+(hash-table-count keys)
+; expect 4
+
+;;; Memoization
+
+(define (tree-fib n)
+  (if (< n 2) n (+ (tree-fib (- n 1)) (tree-fib (- n 2)))))
+(define tree-fib (memoize tree-fib 10))
+(tree-fib 80)
+; expect 23416728348467685
+
+(memoize-stats tree-fib)
+; expect (78 81 71 10)
+
+(list (tree-fib 80) (memoize-stats tree-fib))
+; expect (23416728348467685 (79 81 71 10))
+
+(memoize-clear! tree-fib)
+(memoize-stats tree-fib)
+; expect (79 81 71 0)
+
+;;; Constant folding
+
+(define (classify x)
+  (cond ((< 3 2) 'never) ((= x (* 2 3)) 'six) ((< 1 2) 'other) (else 'none)))
+(list (classify 6) (classify 7))
+; expect (six other)
+
+(let ((car cdr)) (car '(1 2)))
+; expect (2)
+
+(define (flip not) (not (+ 1 2)))
+(flip (lambda (x) (- x)))
+; expect -3
+
+(define real-quotient quotient)
+(define (half) (quotient 10 2))
+(define later (delay (quotient 10 2)))
+(define (quotient a b) 'redefined)
+(list (half) (force later) (quotient 10 2))
+; expect (redefined redefined redefined)
+
+(define quotient real-quotient)
+(half)
+; expect 5
+
+;;; Output ports
+
+(output-port? (current-output-port))
+; expect True
+
+(begin (display 'abc (current-output-port))
+       (flush-output)
+       (newline (current-output-port)))
+; expect abc
+
+(display 1 2)
+; expect Error
+
+;;; Strings and string ports
+
+(string-append "ab" (substring "xcdx" 1 3) "")
+; expect "abcd"
+
+(list (string? "a") (symbol? "a") (string-length "a\"b"))
+; expect (True False 3)
+
+(begin (display "tab\there") (newline))
+; expect tab	here
+
+(define out (open-output-string))
+(begin (display "n = " out) (write "s" out) (display 1 out)
+       (get-output-string out))
+; expect "n = \"s\"1"
+
+(define in (open-input-string "(x \"y\") 2"))
+(list (read in) (read in) (eof? (read in)))
+; expect ((x "y") 2 True)
+
+(substring "abc" 2 1)
+; expect Error
+
+(list (string->number "-12") (string->number ".5e1") (string->number "1x"))
+; expect (-12 5.0 False)
+
+(list (string->number "") (string->number "+") (string->number "e5")
+      (string->number "."))
+; expect (False False False False)
+
+;;; Promises and streams
+
+(define forced 0)
+(define promise (delay (begin (define forced (+ forced 1)) forced)))
+(list (force promise) (force promise) forced)
+; expect (1 1 1)
+
+(define (integers-from n) (cons-stream n (integers-from (+ n 1))))
+(define (stream-ref s n) (if (= n 0) (stream-car s) (stream-ref (stream-cdr s) (- n 1))))
+(stream-ref (stream-map (lambda (x) (* x 2)) (integers-from 0)) 20000)
+; expect 40000
+
+(stream->list
+  (stream-take (stream-filter (lambda (x) (= (modulo x 3) 0))
+                              (integers-from 1))
+               4))
+; expect (3 6 9 12)
+
+(stream-cdr '(1 2))
+; expect Error
+
 ;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;
 ;; Part 3 -- Scheme Implementations ;;
 ;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;;